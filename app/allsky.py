@@ -0,0 +1,171 @@
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from sgp4.api import Satrec, SatrecArray
+
+WGS84_A = 6378.137  # km
+WGS84_F = 1 / 298.257223563
+UNIX_EPOCH_JD = 2440587.5
+
+
+def observer_ecef(lat, lon, alt_m=0.0):
+    """WGS84 observer position (km) and its local east/north/up unit vectors."""
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    e2 = WGS84_F * (2 - WGS84_F)
+    n = WGS84_A / np.sqrt(1 - e2 * np.sin(lat) ** 2)
+    h = alt_m / 1000.0
+    position = np.array([
+        (n + h) * np.cos(lat) * np.cos(lon),
+        (n + h) * np.cos(lat) * np.sin(lon),
+        (n * (1 - e2) + h) * np.sin(lat),
+    ])
+    east = np.array([-np.sin(lon), np.cos(lon), 0.0])
+    north = np.array([-np.sin(lat) * np.cos(lon), -np.sin(lat) * np.sin(lon), np.cos(lat)])
+    up = np.array([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+    return position, east, north, up
+
+
+def gmst_radians(jd, fr):
+    """Greenwich mean sidereal time (IAU 1982) for Julian date arrays."""
+    d = (jd - 2451545.0) + fr
+    t = d / 36525.0
+    gmst = 280.46061837 + 360.98564736629 * d + 0.000387933 * t ** 2 - t ** 3 / 38710000.0
+    return np.radians(gmst % 360.0)
+
+
+class AllSkyScheduler:
+    """Pass timeline for every satellite in a TleCatalog at once.
+
+    The whole catalog is propagated in one call through sgp4's SatrecArray
+    over a shared time grid, converted to observer elevation/azimuth with
+    array math, and scanned for horizon crossings. The timeline is
+    propagated 1.5x the served window ahead, so a cached result still covers
+    ``hours`` of passes until the catalog reloads or half of the window has
+    elapsed. Passes still up at the end of the timeline have an unknown LOS
+    and are flagged with ``los_clamped``.
+    """
+
+    def __init__(self, tle_catalog, lat, lon, alt_m=0.0, hours=6, step_seconds=30):
+        self.tle_catalog = tle_catalog
+        self.lat = lat
+        self.lon = lon
+        self.alt_m = alt_m
+        self.hours = hours
+        self.step_seconds = step_seconds
+        self.passes = None
+        self.computed_at = None
+        self.covered_until = None
+        self.catalog_mtime = None
+        self.lock = threading.Lock()
+
+    def look_angles(self, records, times):
+        """Elevation and azimuth (degrees), shape (satellites, times), for unix ``times``."""
+        satrecs = SatrecArray([Satrec.twoline2rv(r[1], r[2]) for r in records])
+        jd_full = times / 86400.0 + UNIX_EPOCH_JD
+        jd = np.floor(jd_full - 0.5) + 0.5
+        fr = jd_full - jd
+        errors, r_teme, _ = satrecs.sgp4(jd, fr)
+
+        # TEME -> Earth-fixed by rotating through GMST (polar motion ignored)
+        theta = gmst_radians(jd, fr)
+        cos_t, sin_t = np.cos(theta), np.sin(theta)
+        x = cos_t * r_teme[..., 0] + sin_t * r_teme[..., 1]
+        y = -sin_t * r_teme[..., 0] + cos_t * r_teme[..., 1]
+        z = r_teme[..., 2]
+
+        position, east, north, up = observer_ecef(self.lat, self.lon, self.alt_m)
+        rho = np.stack([x, y, z], axis=-1) - position
+        rng = np.linalg.norm(rho, axis=-1)
+        el = np.degrees(np.arcsin((rho @ up) / rng))
+        az = np.degrees(np.arctan2(rho @ east, rho @ north)) % 360.0
+        el[errors != 0] = -90.0
+        return el, az
+
+    def compute(self, now=None, hours=None):
+        """Passes between ``now`` and ``hours`` (default 1.5x the window) ahead."""
+        now = now or time.time()
+        records = list(self.tle_catalog.by_norad.values())
+        if not records:
+            return []
+        span = (hours or self.hours * 1.5) * 3600
+        times = now + np.arange(0, span + self.step_seconds, self.step_seconds)
+        el, az = self.look_angles(records, times)
+
+        passes = []
+        up = el > 0
+        # +1 where a satellite rises between two samples, -1 where it sets
+        edges = np.diff(up.astype(np.int8), axis=1)
+        for i, record in enumerate(records):
+            rises = list(np.flatnonzero(edges[i] == 1) + 1)
+            sets = list(np.flatnonzero(edges[i] == -1) + 1)
+            if up[i, 0]:
+                rises.insert(0, 0)
+            if up[i, -1]:
+                sets.append(len(times) - 1)
+            for start, end in zip(rises, sets):
+                peak = start + int(np.argmax(el[i, start:end + 1]))
+                passes.append({
+                    "name": record[0],
+                    "norad_id": int(record[1][2:7]),
+                    "aos": self._crossing(times, el[i], start),
+                    "aos_az": round(float(az[i, start]), 1),
+                    "tca": float(times[peak]),
+                    "max_el": round(float(el[i, peak]), 1),
+                    "los": self._crossing(times, el[i], end),
+                    "los_az": round(float(az[i, end]), 1),
+                    "los_clamped": bool(up[i, -1] and end == len(times) - 1),
+                })
+        passes.sort(key=lambda p: p["aos"])
+        return passes
+
+    def _crossing(self, times, el, index):
+        """Linearly interpolated horizon crossing time next to sample ``index``."""
+        if index == 0 or index == len(times) - 1:
+            return float(times[index])
+        a, b = el[index - 1], el[index]
+        if a == b:
+            return float(times[index])
+        frac = a / (a - b)
+        return float(times[index - 1] + frac * (times[index] - times[index - 1]))
+
+    def get_passes(self, min_elevation=0.0, hours=None, now=None):
+        """Upcoming and current passes, sorted by AOS and filtered by max elevation."""
+        now = now or time.time()
+        end = now + (hours or self.hours) * 3600
+        self.tle_catalog.refresh()
+        with self.lock:
+            stale = (self.passes is None
+                     or self.catalog_mtime != self.tle_catalog.mtime
+                     or now - self.computed_at > self.hours * 3600 / 2
+                     or end > self.covered_until)
+            if stale:
+                span = max(self.hours * 1.5, hours or 0)
+                self.passes = self.compute(now, span)
+                self.computed_at = now
+                self.covered_until = now + span * 3600
+                self.catalog_mtime = self.tle_catalog.mtime
+            passes = self.passes
+        return [dict(p, up_now=p["aos"] <= now) for p in passes
+                if p["los"] > now and p["aos"] < end and p["max_el"] >= min_elevation]
+
+    def to_json(self, passes):
+        def iso(t):
+            return datetime.fromtimestamp(t, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        return [dict(p, aos=iso(p["aos"]), tca=iso(p["tca"]), los=iso(p["los"])) for p in passes]
+
+
+if __name__ == "__main__":
+    import json
+
+    from tlecatalog import get_catalog
+
+    sky = AllSkyScheduler(get_catalog("tle.txt"), 13.808596988865355, 99.78500659188863)
+    for hours in (1, 6):
+        passes = sky.get_passes(hours=hours)
+        # /api/passes hands this straight to jsonify; numpy scalars would break it
+        json.dumps(sky.to_json(passes))
+        print(f"{len(passes)} passes in the next {hours} h, "
+              f"{sum(p['los_clamped'] for p in passes)} with LOS past the timeline")
@@ -1,51 +1,112 @@
-import numpy as np
-from numpy import long
-from rigcontrol import RigCtlClient
+from rigcontrol import AsyncRigCtlClient
+from maptracker import MapRenderCache
+from sattrack import get_timescale
+from tlecatalog import get_catalog
+from sqfdb import SqfDatabase
 from dopplercal import DopplerCalculator
-from maptracker import SatelliteTrackPlotter
-from sattrack import SatelliteTracker
-import ephem
-import time
-import threading
+from allsky import AllSkyScheduler
+from trackengine import TrackingEngine, TrackingSession
+from metrics import REGISTRY, HTTP_REQUEST_SECONDS
 
-from flask import Flask, jsonify, request, send_file, render_template
+import time
+from flask import Flask, Response, abort, g, jsonify, request, make_response, render_template, send_from_directory, stream_with_context
 
 
 app = Flask(__name__, template_folder='templates')
 
 GRID_LOCATOR = "NK93"
 ALTITUDE = 11  # in meters
+TLE_FILE = "tle.txt"
+SQF_FILE = "doppler.sqf"
+MAP_REFRESH_SECONDS = 10
+RIG_STEP_HZ = 1  # smallest frequency step the rig accepts
+RIG_COMMAND_TIMEOUT = 3  # seconds a web request waits for a rig command
+RIG_POLL_SECONDS = 2.0  # how often the VFO is read back to catch dial changes
+DEFAULT_SESSION = "main"
+PASS_HOURS = 12  # all-sky pass search window
+GROUNDTRACK_MAX_MINUTES = 24 * 60  # longest ?duration= for /api/groundtrack
+GROUNDTRACK_MAX_STEP = 3600  # longest ?step= in seconds
+GROUNDTRACK_MAX_POINTS = 2000  # ?step= is raised so a track never has more points
 SQF_DATA = "ISS,437800,145990,FM,FM,NOR,0,0,FM tone 67.0Hz 9k6 GFSK"
 #SQF_DATA = "RS-44,435640,145965,USB,LSB,REV,0,0,SSB"
 #SQF_DATA = "FO-29,435850,145950,USB,LSB,REV,0,0,SSB"
 #SQF_DATA = "MO-122,435825,145925,USB,LSB,REV,0,0,SSB"
 
 
-# Global state for rig control
-# This will be updated by the doppler_loop thread
-RIG_CONTROL = {
-    "tx_tune_freq": 0,
-    "rx_tune_freq": 0,
-    "doppler_rx": 0,
-    "doppler_tx": 0,
-    "rx_actual_freq": 0,
-    "tx_actual_freq": 0,
-    "running": True
-}
-
-# Satellite information for the UI
-# This can be dynamically updated based on the SQF data or other sources
-SAT_INFO = {
-    "name": None,
-    "uplink_freq": 0,  # in kHz
-    "downlink_freq": 0,  # in kHz
-    "mode": None,
-    "sqf_data": SQF_DATA,
-    "TLE_DATA": None
-}
-
-thread_rig = None
-rig = RigCtlClient()
+rig = AsyncRigCtlClient(timeout=RIG_COMMAND_TIMEOUT)
+tle_catalog = get_catalog(TLE_FILE)
+sqf_db = SqfDatabase(SQF_FILE, tle_catalog=tle_catalog)
+map_cache = MapRenderCache(interval_seconds=MAP_REFRESH_SECONDS)
+tracking = TrackingEngine()
+observer_lat, observer_lon = DopplerCalculator().grid_to_latlon(GRID_LOCATOR)
+sky = AllSkyScheduler(tle_catalog, observer_lat, observer_lon, ALTITUDE, hours=PASS_HOURS)
+
+
+REGISTRY.callback(
+    "pysattune_rig_queue_depth", "Commands waiting in each session's rig queue.", ["session"],
+    lambda: [((sid,), session.rig.pending()) for sid, session in list(tracking.sessions.items())])
+REGISTRY.callback(
+    "pysattune_rig_coalesced_writes_total", "Frequency writes superseded before being sent.", ["session"],
+    lambda: [((sid,), session.rig.stats()["dropped_writes"]) for sid, session in list(tracking.sessions.items())],
+    kind="counter")
+REGISTRY.callback(
+    "pysattune_rig_freq_reads_total", "VFO reads that went to the rig (source=rig) or the shadow cache.",
+    ["session", "source"],
+    lambda: [((sid, source), count)
+             for sid, session in list(tracking.sessions.items())
+             for source, count in (("rig", session.shadow.reads), ("cache", session.shadow.cached_reads))],
+    kind="counter")
+
+
+def new_session(session_id, sqf_data, rig_client):
+    return TrackingSession(session_id, sqf_data, rig_client, tle_catalog, GRID_LOCATOR, ALTITUDE,
+                           step_hz=RIG_STEP_HZ, poll_seconds=RIG_POLL_SECONDS)
+
+
+def find_transponder(sat, index):
+    """SQF row ``index`` of ``sat`` and an error response, one of them None.
+
+    A row is only usable when tle.txt has a TLE for its satellite.
+    """
+    transponder = sqf_db.get_transponder(sat or "", index)
+    if transponder is None:
+        return None, (jsonify({"error": f"No transponder {index} for '{sat}'"}), 404)
+    if tle_catalog.get(transponder["satellite"]) is None:
+        return None, (jsonify({"error": f"No TLE for '{transponder['satellite']}' in {TLE_FILE}"}), 409)
+    return transponder, None
+
+
+def default_session_tle():
+    """TLE of the current default session, looked up on every call, or None."""
+    session = tracking.get(DEFAULT_SESSION)
+    return session.sat_info["TLE_DATA"] if session is not None else None
+
+
+def get_session(sid):
+    session = tracking.get(sid)
+    if session is None:
+        abort(404, description=f"No tracking session '{sid}'")
+    return session
+
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_latency(response):
+    started = g.get("request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        HTTP_REQUEST_SECONDS.labels(route).observe(time.perf_counter() - started)
+    return response
+
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus text exposition of loop, rig, route and map timings."""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route('/api/version')
@@ -56,52 +117,118 @@ def get_data():
     }
     return jsonify(data)
 
-@app.route('/api/rig')
-def get_rig_data():
-    data = {
-        'RIG_CONTROL': {
-            k: int(v) if isinstance(v, (int, np.integer)) else v
-            for k, v in RIG_CONTROL.items()
-        }
-    }
-    return jsonify(data)
+@app.route('/api/sessions')
+def list_sessions():
+    return jsonify({"sessions": [session.describe() for session in tracking.sessions.values()]})
 
 
-@app.route('/api/resetrig')
-def get_resetrig():
-    global thread_rig
+@app.route('/api/sessions/<sid>/start')
+def start_session(sid):
+    """Start tracking ?sat=&index= on the rigctld at ?host=&port= as session ``sid``."""
+    sat = request.args.get("sat")
+    index = request.args.get("index", 0, type=int)
+    transponder, error = find_transponder(sat, index)
+    if error is not None:
+        return error
+    host = request.args.get("host", "localhost")
+    port = request.args.get("port", 4532, type=int)
+    session = tracking.add(new_session(sid, transponder["sqf_data"], AsyncRigCtlClient(host=host, port=port, timeout=RIG_COMMAND_TIMEOUT)))
+    return jsonify({"status": f"Session {sid} tracking {transponder['satellite']}", "session": session.describe()})
+
+
+@app.route('/api/sessions/<sid>/stop')
+def stop_session(sid):
+    get_session(sid)
+    tracking.remove(sid)
+    return jsonify({"status": f"Session {sid} stopped."})
+
+
+@app.route('/api/rig')
+@app.route('/api/sessions/<sid>/rig')
+def get_rig_data(sid=DEFAULT_SESSION):
+    return jsonify(get_session(sid).rig_state())
 
-    print("Resetting Rig Control...")
 
-    if thread_rig is not None and thread_rig.is_alive():
-        RIG_CONTROL["running"] = False
-        thread_rig.join()
+@app.route('/api/stream')
+@app.route('/api/sessions/<sid>/stream')
+def get_stream(sid=DEFAULT_SESSION):
+    """Server-sent events with "rig" and "track" updates, published once per Doppler tick."""
+    session = get_session(sid)
+    response = Response(stream_with_context(session.telemetry.stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
-    RIG_CONTROL["running"] = True
-    thread_rig = threading.Thread(target=doppler_loop, daemon=True)
-    thread_rig.start()
 
+@app.route('/api/resetrig')
+@app.route('/api/sessions/<sid>/resetrig')
+def get_resetrig(sid=DEFAULT_SESSION):
+    get_session(sid)
+    print(f"Resetting Rig Control for {sid}...")
+    tracking.restart(sid)
     return jsonify({"status": "Rig reset command completed."})
 
 
+@app.route('/api/passes')
+def get_passes():
+    """Pass timeline for the whole TLE catalog, sorted by AOS (?hours=&min_el=)."""
+    hours = request.args.get("hours", PASS_HOURS, type=float)
+    min_el = request.args.get("min_el", 0.0, type=float)
+    passes = sky.get_passes(min_elevation=min_el, hours=min(hours, PASS_HOURS))
+    return jsonify({
+        "up_now": sorted({p["name"] for p in passes if p["up_now"]}),
+        "passes": sky.to_json(passes),
+    })
+
+
+@app.route('/api/transponders')
+def get_transponders():
+    sat = request.args.get("sat")
+    if not sat:
+        return jsonify({"error": "Missing 'sat' parameter"}), 400
+    transponders = sqf_db.get(sat)
+    if not transponders:
+        return jsonify({"error": f"No transponders found for '{sat}'"}), 404
+    return jsonify({"satellite": transponders[0]["satellite"], "transponders": transponders})
+
+
+@app.route('/api/settransponder')
+@app.route('/api/sessions/<sid>/settransponder')
+def set_transponder(sid=DEFAULT_SESSION):
+    session = get_session(sid)
+    sat = request.args.get("sat")
+    index = request.args.get("index", 0, type=int)
+    transponder, error = find_transponder(sat, index)
+    if error is not None:
+        return error
+    session.sat_info["sqf_data"] = transponder["sqf_data"]
+    tracking.restart(sid)
+    return jsonify({"status": f"Tracking {transponder['satellite']}: {transponder['sqf_data']}"})
+
+
 @app.route('/api/setmodeRX', methods=['GET'])
-def set_mode_rx():
+@app.route('/api/sessions/<sid>/setmodeRX', methods=['GET'])
+def set_mode_rx(sid=DEFAULT_SESSION):
     mode = request.args.get("mode")    
-    rig.set_mode(mode=mode)
+    shadow = get_session(sid).shadow
+    tracking.call(shadow.set_mode(mode=mode), timeout=RIG_COMMAND_TIMEOUT + 1)
     return jsonify({"status": f"Setting RX mode to: {mode}"})
 
 @app.route('/api/setmodeTX', methods=['GET'])
-def set_mode_tx():
+@app.route('/api/sessions/<sid>/setmodeTX', methods=['GET'])
+def set_mode_tx(sid=DEFAULT_SESSION):
     mode = request.args.get("mode")    
-    rig.set_split_mode(mode=mode)
+    shadow = get_session(sid).shadow
+    tracking.call(shadow.set_split_mode(mode=mode), timeout=RIG_COMMAND_TIMEOUT + 1)
     return jsonify({"status": f"Setting TX mode to: {mode}"})
 
 
 @app.route("/api/track")
-def track():
-    tle = SAT_INFO["TLE_DATA"]
-    tracker = SatelliteTracker(tle[0], tle[1], tle[2])
-    info = tracker.get_tracking_info()
+@app.route("/api/sessions/<sid>/track")
+def track(sid=DEFAULT_SESSION):
+    info = get_session(sid).tracking_info()
+    if info is None:
+        return jsonify({"error": "TLE data not available"}), 400
     return jsonify(info)
 
 
@@ -111,12 +238,45 @@ def get_satellite_map():
     #     "1 25544U 98067A   25214.49566479  .00011663  00000-0  20985-3 0  9998",
     #     "2 25544  51.6359  77.5427 0002034 138.8478 290.2759 15.50294044522345"
     # ]
-    tle = SAT_INFO["TLE_DATA"]
+    session = get_session(DEFAULT_SESSION)
+    tle = session.sat_info["TLE_DATA"]
     if not tle or len(tle) < 3:
         return jsonify({"error": "TLE data not available"}), 400
-    tracker = SatelliteTrackPlotter(tle)
-    image_stream = tracker.plot_track(duration_minutes=180, interval_seconds=60)
-    return send_file(image_stream, mimetype='image/png')
+    # The PNG map is only rendered once someone asks for it; from then on
+    # one background render per interval serves all viewers. The worker
+    # looks the session up each time, so it follows a replaced "main".
+    map_cache.start_auto_refresh(default_session_tle)
+    entry = map_cache.get(tle)
+    response = make_response(entry["png"])
+    response.mimetype = 'image/png'
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/api/groundtrack')
+@app.route('/api/sessions/<sid>/groundtrack')
+def get_groundtrack(sid=DEFAULT_SESSION):
+    session = get_session(sid)
+    tle = session.sat_info["TLE_DATA"]
+    if not tle or len(tle) < 3:
+        return jsonify({"error": "TLE data not available"}), 400
+    duration = request.args.get("duration", 180, type=int)
+    step = request.args.get("step", 60, type=int)
+    if not 1 <= duration <= GROUNDTRACK_MAX_MINUTES:
+        return jsonify({"error": f"duration must be 1..{GROUNDTRACK_MAX_MINUTES} minutes"}), 400
+    if not 1 <= step <= GROUNDTRACK_MAX_STEP:
+        return jsonify({"error": f"step must be 1..{GROUNDTRACK_MAX_STEP} seconds"}), 400
+    step = max(step, -(-duration * 60 // GROUNDTRACK_MAX_POINTS))
+    plotter = map_cache.plotter_for(tle)
+    return jsonify(plotter.track_data(duration_minutes=duration, interval_seconds=step,
+                                      state=session.ephemeris.current()))
+
+
+@app.route('/map/<path:filename>')
+def get_map_image(filename):
+    return send_from_directory('map', filename)
 
 
 @app.route('/')
@@ -124,90 +284,12 @@ def rig_page():
     return render_template('main.html') 
 
 
-###############################################
-# Doppler calculation loop
-###############################################
-def doppler_loop():
-    doppler_calculator = DopplerCalculator()
-
-    sqf = doppler_calculator.read_sqf_data(sqf_data=SQF_DATA)
-    satellite_name = sqf["satellite"]
-    tx_org_freq = sqf["uplink_freq"] * 1000  # Convert to Hz
-    rx_org_freq = sqf["downlink_freq"] * 1000  # Convert to Hz
-
-    tle_data = doppler_calculator.read_tle(satellite_name=satellite_name)
-    lat, lon = doppler_calculator.grid_to_latlon(GRID_LOCATOR)
-
-    print(tle_data)
-
-    myloc = ephem.Observer()
-    myloc.lon = str(lon)
-    myloc.lat = str(lat)
-    myloc.elevation = ALTITUDE
-
-    mysat = ephem.readtle(tle_data[0].strip(), tle_data[1].strip(), tle_data[2].strip())
-
-    try:
-
-        # Initial Values
-        rx_doppler = 0
-        tx_doppler = 0
-        rig.set_freq(rx_org_freq)
-        rig.set_split()
-        rx_tune = long(rig.get_freq())
-        rx_actual_freq = rx_tune
-        rx_tune_predict = rx_tune
-
-        while RIG_CONTROL["running"]:
-
-
-            # Update frequencies if radio change.
-            if rx_actual_freq != long(rig.get_freq()):
-                rx_tune = long(rig.get_freq()) + rx_doppler
-            else:
-                rx_tune = rx_tune_predict
-
-            rx_doppler = doppler_calculator.dopplercalc(myloc, mysat, F0=rx_org_freq)
-            rx_diff_freq = (rx_tune - rx_doppler) - (rx_org_freq - rx_doppler)
-            rx_tune_predict = rx_org_freq + rx_diff_freq
-            rx_actual_freq = rx_tune_predict - rx_doppler
-
-            rig.set_freq(rx_actual_freq)
-
-            tx_doppler = doppler_calculator.dopplercalc(myloc, mysat, F0=tx_org_freq)
-            tx_tune_predict = tx_org_freq - rx_diff_freq
-            tx_actual_freq = tx_tune_predict - tx_doppler
-
-            rig.set_split_freq(tx_actual_freq)
-
-            print(f"[RX] Tune: {rx_tune_predict}, Doppler: {rx_doppler}, Actual: {rx_actual_freq}")
-            print(f"[TX] Tune: {tx_tune_predict}, Doppler: {tx_doppler}, Actual: {tx_actual_freq}")
-
-            # Update global state
-            RIG_CONTROL["rx_actual_freq"] = rx_actual_freq
-            RIG_CONTROL["tx_actual_freq"] = tx_actual_freq
-            RIG_CONTROL["rx_tune_freq"] = rx_tune_predict
-            RIG_CONTROL["tx_tune_freq"] = tx_tune_predict
-            RIG_CONTROL["doppler_rx"] = rx_doppler
-            RIG_CONTROL["doppler_tx"] = tx_doppler
-            SAT_INFO["name"] = satellite_name
-            SAT_INFO["uplink_freq"] = tx_org_freq // 1000  # Convert to kHz
-            SAT_INFO["downlink_freq"] = rx_org_freq // 1000  # Convert to kHz
-
-            
-            SAT_INFO["TLE_DATA"] = tle_data
-
-            time.sleep(1)
-    except KeyboardInterrupt:
-        rig.reset_split()
-        print("\nExiting Doppler calculation loop.")
-
-
 if __name__ == "__main__":
-    # Start doppler loop in background
-    #global thread_rig 
-    thread_rig = threading.Thread(target=doppler_loop, daemon=True)
-    thread_rig.start()
+    # Load the shared Skyfield timescale once, before the first request
+    get_timescale()
+
+    # Start Doppler tracking for the default rig on the tracking event loop
+    tracking.add(new_session(DEFAULT_SESSION, SQF_DATA, rig))
 
     # Start Flask server
     app.run(debug=True, use_reloader=False)  # use_reloader=False avoids double-threading issue on reload
@@ -0,0 +1,417 @@
+"""Offline benchmarks for the tracking, Doppler, map and rig hot paths.
+
+Runs against the bundled tle.txt / doppler.sqf with a frozen clock set
+inside an ISS pass shortly after the TLE epoch, and simulated radios from
+rigsim, so results are reproducible on any machine without network or radio.
+
+    python app/benchmark.py                      # all benchmarks
+    python app/benchmark.py --only rig,tick      # names containing "rig" or "tick"
+    python app/benchmark.py --compare old.json   # p50 change against an earlier run
+    python app/benchmark.py --only import --check   # fail if startup is over budget
+
+Results (latency distribution, throughput and peak traced memory per hot
+path) are written as JSON, tagged with the git commit, for comparing runs.
+Cold import times of the entry modules are measured in fresh interpreters
+and checked against IMPORT_BUDGET_SECONDS.
+"""
+import argparse
+import asyncio
+import importlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timezone
+from unittest import mock
+
+import numpy as np
+
+from rigsim import RigctldSimulator, VirtualRadio
+
+TLE_FILE = "tle.txt"
+SQF_FILE = "doppler.sqf"
+GRID_LOCATOR = "NK93"
+ALTITUDE = 11  # in meters
+SATELLITE = "ISS"
+TRANSPONDER = 2  # ISS 437.800 / 145.990 FM repeater, a full-duplex split
+OUTPUT_FILE = "bench_results.json"
+MEMORY_ITERATIONS = 20  # tracemalloc slows calls down, so memory gets its own short run
+MULTI_RIG_COUNT = 8
+MULTI_RIG_LATENCY = 0.005  # seconds per CAT command on each simulated radio
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+IMPORT_RUNS = 3  # fresh interpreters per module; the fastest run is reported
+# Cold import budget per entry module; the Doppler/rig path must stay light
+IMPORT_BUDGET_SECONDS = {"dopplercal": 0.3, "rigcontrol": 0.2, "trackengine": 0.5, "app": 1.0}
+# Only /satmap and the legacy PyEphem helpers should ever load these
+HEAVY_MODULES = ("matplotlib", "mpl_toolkits.basemap", "geocoder", "requests", "gpsd", "ephem")
+IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(0, {app_dir!r})
+t = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - t
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+class FrozenClock:
+    """Controllable wall clock patched over time.time() and datetime.now()/utcnow()."""
+
+    def __init__(self, t):
+        self.t = float(t)
+
+    def time(self):
+        return self.t
+
+    def advance(self, seconds):
+        self.t += seconds
+
+    @contextmanager
+    def installed(self):
+        clock = self
+
+        class FrozenDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(clock.t, tz)
+
+            @classmethod
+            def utcnow(cls):
+                return datetime.fromtimestamp(clock.t, timezone.utc).replace(tzinfo=None)
+
+        patches = [
+            mock.patch("time.time", self.time),
+            mock.patch("dopplercal.gmtime", lambda: time.gmtime(clock.t)),
+        ]
+        for module in ("sattrack", "maptracker"):
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                continue
+            patches.append(mock.patch(f"{module}.datetime", FrozenDatetime))
+        for patch in patches:
+            patch.start()
+        try:
+            yield self
+        finally:
+            for patch in reversed(patches):
+                patch.stop()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(fn, iterations, warmup=3):
+    """Latency distribution, throughput and peak traced memory for ``fn()``."""
+    with redirect_stdout(io.StringIO()):
+        for _ in range(warmup):
+            fn()
+
+        samples = np.empty(iterations)
+        started = time.perf_counter()
+        for i in range(iterations):
+            t0 = time.perf_counter()
+            fn()
+            samples[i] = time.perf_counter() - t0
+        elapsed = time.perf_counter() - started
+
+        tracemalloc.start()
+        for _ in range(min(iterations, MEMORY_ITERATIONS)):
+            fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    us = samples * 1e6
+    return {
+        "iterations": iterations,
+        "mean_us": round(float(us.mean()), 2),
+        "min_us": round(float(us.min()), 2),
+        "p50_us": round(float(np.percentile(us, 50)), 2),
+        "p90_us": round(float(np.percentile(us, 90)), 2),
+        "p99_us": round(float(np.percentile(us, 99)), 2),
+        "max_us": round(float(us.max()), 2),
+        "throughput_per_s": round(iterations / elapsed, 1),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+
+def import_time(module, runs=IMPORT_RUNS):
+    """Cold import time of ``module`` and the heavy modules it drags in, or None if it fails."""
+    best = None
+    for _ in range(runs):
+        probe = IMPORT_PROBE.format(app_dir=APP_DIR, module=module, heavy=HEAVY_MODULES)
+        result = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True)
+        if result.returncode != 0:
+            return None
+        sample = json.loads(result.stdout.strip().splitlines()[-1])
+        if best is None or sample["seconds"] < best["seconds"]:
+            best = sample
+    budget = IMPORT_BUDGET_SECONDS[module]
+    return {
+        "seconds": round(best["seconds"], 3),
+        "budget_seconds": budget,
+        "heavy_modules": best["heavy"],
+        "over_budget": best["seconds"] > budget or bool(best["heavy"]),
+    }
+
+
+def import_times():
+    results = {}
+    for module in IMPORT_BUDGET_SECONDS:
+        results[module] = stats = import_time(module)
+        if stats is None:
+            print(f"import {module:<13} skipped: import failed")
+            continue
+        status = "OVER BUDGET" if stats["over_budget"] else "ok"
+        heavy = f"   loads {', '.join(stats['heavy_modules'])}" if stats["heavy_modules"] else ""
+        print(f"import {module:<13} {stats['seconds'] * 1000:>8.1f} ms   budget "
+              f"{stats['budget_seconds'] * 1000:>6.0f} ms   {status}{heavy}")
+    return results
+
+
+class BenchmarkSuite:
+    def __init__(self, scale=1.0):
+        from dopplercal import DopplerCalculator
+        from ephemeris import EphemerisService
+        from tlecatalog import get_catalog
+
+        self.scale = scale
+        self.tmpdir = tempfile.mkdtemp(prefix="pysattune-bench-")
+        self.tle_catalog = get_catalog(TLE_FILE)
+        self.tle = self.tle_catalog.get(SATELLITE)
+        if self.tle is None:
+            raise SystemExit(f"No TLE for {SATELLITE} in {TLE_FILE}")
+        self.lat, self.lon = DopplerCalculator().grid_to_latlon(GRID_LOCATOR)
+
+        # Freeze the clock one minute after AOS of the first pass after the
+        # TLE epoch, so every run sees the same geometry and a visible satellite.
+        epoch = datetime.strptime(self.tle[1][18:23], "%y%j").replace(tzinfo=timezone.utc)
+        epoch = epoch.timestamp() + float(self.tle[1][23:32]) * 86400
+        aos, los = EphemerisService(self.tle, self.lat, self.lon, ALTITUDE).next_pass(epoch)
+        self.frozen_at = aos + 60
+        self.clock = FrozenClock(self.frozen_at)
+        self.simulator = RigctldSimulator().start()
+        self.rig_port = self.simulator.add_radio(VirtualRadio())
+        self.loops = []
+        self.benchmarks = [
+            ("dopplercalc", self.bench_dopplercalc, 500),
+            ("doppler_engine", self.bench_doppler_engine, 5000),
+            ("pass_table_build", self.bench_pass_table, 10),
+            ("ephemeris_state", self.bench_ephemeris_state, 500),
+            ("tracking_info", self.bench_tracking_info, 200),
+            ("track_data", self.bench_track_data, 50),
+            ("plot_track", self.bench_plot_track, 10),
+            ("rig_send_cmd", self.bench_rig_send_cmd, 1000),
+            ("rig_retune", self.bench_rig_retune, 1000),
+            ("async_rig_send_cmd", self.bench_async_rig_send_cmd, 1000),
+            ("multi_rig_retune", self.bench_multi_rig_retune, 100),
+            ("session_tick", self.bench_session_tick, 500),
+        ]
+
+    def new_loop(self, *clients):
+        """Event loop for async benchmarks; ``clients`` are kept alive until close()."""
+        loop = asyncio.new_event_loop()
+        self.loops.append((loop, clients))
+        return loop
+
+    def close(self):
+        async def cancel_all():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        for loop, _ in self.loops:
+            loop.run_until_complete(cancel_all())
+            loop.close()
+        self.loops = []
+        self.simulator.stop()
+
+    def ephemeris(self):
+        from ephemeris import EphemerisService
+        return EphemerisService(self.tle, self.lat, self.lon, ALTITUDE)
+
+    def bench_dopplercalc(self):
+        import ephem
+        from dopplercal import DopplerCalculator
+
+        myloc = ephem.Observer()
+        myloc.lat = str(self.lat)
+        myloc.lon = str(self.lon)
+        myloc.elevation = ALTITUDE
+        mysat = ephem.readtle(*self.tle)
+        calc = DopplerCalculator()
+        return lambda: calc.dopplercalc(myloc, mysat, F0=437800000)
+
+    def bench_doppler_engine(self):
+        from dopplercal import DopplerEngine
+
+        engine = DopplerEngine(self.ephemeris())
+
+        def step():
+            self.clock.advance(0.1)
+            engine.doppler(437800000, engine.apply_time())
+        return step
+
+    def bench_pass_table(self):
+        from dopplercal import DopplerEngine
+        from passplanner import PassPlanner
+
+        ephemeris = self.ephemeris()
+        planner = PassPlanner(ephemeris, cache_dir=self.tmpdir)
+        engine = DopplerEngine(ephemeris, planner=planner)
+        span = planner.find_pass(engine, self.clock.time())
+        return lambda: planner.build(engine, *span)
+
+    def bench_ephemeris_state(self):
+        ephemeris = self.ephemeris()
+
+        def step():
+            self.clock.advance(0.5)
+            ephemeris.state(self.clock.time())
+        return step
+
+    def bench_tracking_info(self):
+        from sattrack import SatelliteTracker
+
+        tracker = SatelliteTracker(*self.tle, lat=self.lat, lon=self.lon, alt_m=ALTITUDE)
+        return tracker.get_tracking_info
+
+    def bench_track_data(self):
+        from maptracker import SatelliteTrackPlotter
+
+        plotter = SatelliteTrackPlotter(self.tle)
+        return lambda: plotter.track_data(duration_minutes=180, interval_seconds=60)
+
+    def bench_plot_track(self):
+        from maptracker import SatelliteTrackPlotter
+
+        plotter = SatelliteTrackPlotter(self.tle)
+        return lambda: plotter.plot_track(duration_minutes=180, interval_seconds=60)
+
+    def bench_rig_send_cmd(self):
+        from rigcontrol import RigCtlClient
+
+        rig = RigCtlClient(port=self.rig_port)
+        return rig.get_freq
+
+    def bench_rig_retune(self):
+        from rigcontrol import RigCtlClient
+
+        rig = RigCtlClient(port=self.rig_port)
+        return lambda: rig.retune(437800000, 145990000)
+
+    def bench_async_rig_send_cmd(self):
+        from rigcontrol import AsyncRigCtlClient
+
+        rig = AsyncRigCtlClient(port=self.rig_port)
+        loop = self.new_loop(rig)
+        return lambda: loop.run_until_complete(rig.get_freq())
+
+    def bench_multi_rig_retune(self):
+        """Concurrent retunes on several slow radios; should cost about one radio's retune."""
+        from rigcontrol import AsyncRigCtlClient
+
+        rigs = [AsyncRigCtlClient(port=self.simulator.add_radio(VirtualRadio(latency=MULTI_RIG_LATENCY)))
+                for _ in range(MULTI_RIG_COUNT)]
+        loop = self.new_loop(*rigs)
+
+        async def retune_all():
+            await asyncio.gather(*(rig.retune(437800000, 145990000) for rig in rigs))
+        return lambda: loop.run_until_complete(retune_all())
+
+    def bench_session_tick(self):
+        """End-to-end Doppler tick: cached dial check, Doppler, retune, state publish."""
+        from rigcontrol import AsyncRigCtlClient
+        from sqfdb import SqfDatabase
+        from trackengine import TrackingSession
+
+        with redirect_stdout(io.StringIO()):
+            transponder = SqfDatabase(SQF_FILE).get_transponder(SATELLITE, TRANSPONDER)
+        session = TrackingSession("bench", transponder["sqf_data"], AsyncRigCtlClient(port=self.rig_port),
+                                  self.tle_catalog, GRID_LOCATOR, ALTITUDE)
+        loop = self.new_loop(session)
+        with redirect_stdout(io.StringIO()):
+            loop.run_until_complete(session.setup())
+        session.doppler_engine.planner.cache_dir = self.tmpdir
+
+        def step():
+            self.clock.advance(0.5)
+            loop.run_until_complete(session.tick())
+        return step
+
+    def run(self, only=None):
+        results = {}
+        for name, factory, iterations in self.benchmarks:
+            if only and not any(pattern in name for pattern in only):
+                continue
+            self.clock.t = self.frozen_at
+            with self.clock.installed():
+                try:
+                    fn = factory()
+                except ImportError as e:
+                    print(f"{name:<20} skipped: {e}")
+                    continue
+                results[name] = stats = measure(fn, max(1, int(iterations * self.scale)))
+            print(f"{name:<20} p50 {stats['p50_us']:>10.1f} us   p99 {stats['p99_us']:>10.1f} us"
+                  f"   {stats['throughput_per_s']:>9.1f}/s   peak {stats['peak_kib']:>8.1f} KiB")
+        imports = {}
+        if not only or any(pattern in "import" for pattern in only):
+            imports = import_times()
+        return {
+            "meta": {
+                "commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "frozen_at": self.frozen_at,
+                "satellite": SATELLITE,
+            },
+            "results": results,
+            "imports": imports,
+        }
+
+
+def compare(report, baseline):
+    print(f"\nCompared with {baseline['meta'].get('commit')}:")
+    for name, stats in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None:
+            continue
+        change = (stats["p50_us"] - old["p50_us"]) / old["p50_us"] * 100 if old["p50_us"] else 0.0
+        print(f"{name:<20} p50 {old['p50_us']:>10.1f} -> {stats['p50_us']:>10.1f} us  ({change:+.1f}%)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", help="comma-separated substrings of benchmark names")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply iteration counts")
+    parser.add_argument("--output", default=OUTPUT_FILE, help="JSON results file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if an import is over budget")
+    args = parser.parse_args()
+
+    suite = BenchmarkSuite(scale=args.scale)
+    try:
+        report = suite.run(only=args.only.split(",") if args.only else None)
+    finally:
+        suite.close()
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    if args.check and any(stats and stats["over_budget"] for stats in report["imports"].values()):
+        sys.exit(1)
@@ -0,0 +1,76 @@
+import json
+import queue
+import threading
+
+CLOSED = object()  # sentinel that ends every stream() of a closed Broadcaster
+
+
+class Broadcaster:
+    """Fan-out of published events to any number of subscriber queues.
+
+    Each subscriber gets its own bounded queue; a slow subscriber only ever
+    loses its own oldest events and never blocks the publisher. ``close()``
+    ends every open stream, so clients reconnect instead of waiting on a
+    source that will never publish again.
+    """
+
+    def __init__(self, maxsize=10):
+        self.maxsize = maxsize
+        self.subscribers = set()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def subscribe(self):
+        q = queue.Queue(maxsize=self.maxsize)
+        with self.lock:
+            self.subscribers.add(q)
+        return q
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def publish(self, event, data):
+        """Send ``data`` (JSON-serialisable) as an SSE message of type ``event``."""
+        self._put(f"event: {event}\ndata: {json.dumps(data)}\n\n")
+
+    def close(self):
+        """End every current and future stream."""
+        self.closed = True
+        self._put(CLOSED)
+
+    def _put(self, message):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    q.put_nowait(message)
+                except queue.Full:
+                    pass
+
+    def stream(self, keepalive_seconds=15):
+        """Generator of SSE messages for one subscriber, for a Flask streaming response."""
+        q = self.subscribe()
+        try:
+            yield ": connected\n\n"
+            while not self.closed:
+                try:
+                    message = q.get(timeout=keepalive_seconds)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if message is CLOSED:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(q)
@@ -1,15 +1,9 @@
-import os
 from time import gmtime, strftime
-import ephem
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
-import geocoder
 import numpy as np
-import requests
 import warnings
-import gpsd
-import geocoder
 import time
+from tlecatalog import get_catalog
+from sqfdb import parse_sqf_line
 
 warnings.filterwarnings("ignore")
 
@@ -22,37 +16,18 @@ class DopplerCalculator:
         pass
 
     def read_tle(self, filename="tle.txt", satellite_name=None):
-        """Read TLE data for a given satellite from a file."""
-        try:
-            with open(filename, 'r') as f:
-                lines = f.readlines()
-        except FileNotFoundError:
-            print(f"File {filename} does not exist.")
-            return None
-
-        for i in range(0, len(lines) - 2, 3):
-            if lines[i].strip() == satellite_name:
-                return lines[i:i+3]
-        print(f"Satellite '{satellite_name}' not found in TLE data.")
-        return None
+        """Look up TLE data for a given satellite in the shared TLE catalog."""
+        tle = get_catalog(filename).get(satellite_name)
+        if tle is None:
+            print(f"Satellite '{satellite_name}' not found in TLE data.")
+        return tle
     
     def read_sqf_data(self, sqf_data=SQF_DATA):
         """Parse SQF data string and return its components as a dictionary."""
-        fields = sqf_data.split(",")
-        if len(fields) < 8:
+        sqf = parse_sqf_line(sqf_data)
+        if sqf is None:
             print("Invalid SQF data format.")
-            return None
-        return {
-            "satellite": fields[0],
-            "downlink_freq": int(fields[1]),
-            "uplink_freq": int(fields[2]),
-            "downlink_mode": fields[3],
-            "uplink_mode": fields[4],
-            "norad_id": fields[5],
-            "uplink_offset": int(fields[6]),
-            "downlink_offset": int(fields[7]),
-            "notes": ",".join(fields[8:]) if len(fields) > 8 else ""
-        }
+        return sqf
     
     def grid_to_latlon(self, grid):
         if not isinstance(grid, str) or len(grid) < 4:
@@ -82,7 +57,172 @@ class DopplerCalculator:
         return doppler
     
 
+SPEED_OF_LIGHT = 299792458.0
+
+
+def doppler_shift(F0, range_rate):
+    """Doppler offset in Hz for carrier ``F0`` at a range-rate in m/s.
+
+    Positive while the satellite recedes, i.e. the received frequency is
+    ``F0`` minus this value; the sign convention used throughout the loop.
+    """
+    return int(round(range_rate * F0 / SPEED_OF_LIGHT))
+
+
+class DopplerEngine:
+    """Predictive Doppler from a range-rate table interpolated at sub-second resolution.
+
+    Range-rate is sampled from the shared EphemerisService every
+    ``step_seconds`` over a rolling window and linearly interpolated, and
+    each value is projected forward to the time the rig is expected to
+    apply it: now plus the measured command latency (an exponential moving
+    average fed by ``record_latency``).
+    """
+
+    def __init__(self, ephemeris, step_seconds=1.0, window_seconds=600,
+                 initial_lead=0.1, lead_alpha=0.2, planner=None):
+        self.ephemeris = ephemeris
+        self.planner = planner
+        self.valid_until = None
+        self.step_seconds = step_seconds
+        self.window_seconds = window_seconds
+        self.lead = initial_lead
+        self.lead_alpha = lead_alpha
+        self.times = None
+        self.range_rates = None
+        self.range_accels = None
+        self.elevations = None
+
+    def set_tle(self, tle):
+        """Switch the ephemeris to a new TLE (e.g. after a catalog refresh) and drop the table."""
+        self.ephemeris.set_tle(tle)
+        self.times = None
+        if self.planner is not None:
+            self.planner.reset()
+
+    def sample(self, start, end, step_seconds=None):
+        """Range-rate (m/s) and elevation (deg) at ``step_seconds`` intervals between two unix times."""
+        return self.ephemeris.sample(start, end, step_seconds or self.step_seconds)
+
+    def set_table(self, times, range_rates, elevations, valid_until):
+        self.times = times
+        self.range_rates = range_rates
+        self.elevations = elevations
+        self.range_accels = np.gradient(range_rates, times)
+        self.valid_until = valid_until
+
+    def refresh(self, t):
+        """Make sure the table covers ``t``.
+
+        During a pass the planner's precomputed table is used, so no orbital
+        math runs in the loop; otherwise a rolling window is sampled.
+        """
+        if self.times is not None and self.times[0] <= t <= self.valid_until:
+            return
+
+        if self.planner is not None:
+            table = self.planner.table_for(self, t)
+            if table is not None:
+                self.set_table(table[0], table[1], table[2], table[0, -1])
+                return
+
+        start = np.floor(t) - self.step_seconds
+        times, rates, elevations = self.sample(start, start + self.window_seconds)
+        valid_until = times[-1] - self.window_seconds / 4
+        if self.planner is not None:
+            next_start = self.planner.next_start(self, t)
+            if next_start is not None:
+                valid_until = min(valid_until, next_start)
+        self.set_table(times, rates, elevations, valid_until)
+
+    def range_rate(self, t):
+        self.refresh(t)
+        return float(np.interp(t, self.times, self.range_rates))
+
+    def range_accel(self, t):
+        """Rate of change of range-rate in m/s^2."""
+        self.refresh(t)
+        return float(np.interp(t, self.times, self.range_accels))
+
+    def elevation(self, t):
+        self.refresh(t)
+        return float(np.interp(t, self.times, self.elevations))
+
+    def record_latency(self, seconds):
+        """Feed a measured compute-to-apply latency into the lead estimate."""
+        self.lead += self.lead_alpha * (seconds - self.lead)
+
+    def apply_time(self, now=None):
+        """Expected time the next command takes effect on the rig."""
+        return (now if now is not None else time.time()) + self.lead
+
+    def doppler(self, F0, t=None):
+        """Doppler shift in Hz for carrier ``F0`` at unix time ``t`` (default: apply time)."""
+        t = self.apply_time() if t is None else t
+        return doppler_shift(F0, self.range_rate(t))
+
+    def doppler_rate(self, F0, t=None):
+        """Rate of change of the Doppler shift in Hz/s for carrier ``F0``."""
+        t = self.apply_time() if t is None else t
+        return self.range_accel(t) * F0 / SPEED_OF_LIGHT
+
+
+# Allowed tuning error per mode before the rig is retuned
+MODE_TOLERANCE_HZ = {
+    "CW": 10,
+    "USB": 20,
+    "LSB": 20,
+    "AM": 100,
+    "FM": 300,
+}
+DEFAULT_TOLERANCE_HZ = 50
+
+
+class DopplerScheduler:
+    """Picks the next Doppler update time from the predicted Doppler rate.
+
+    The interval is the time the Doppler takes to drift by the mode's
+    tolerance, clamped to [min_interval, max_interval]; while the satellite
+    is below ``min_elevation`` the loop idles and no retunes are sent.
+    """
+
+    def __init__(self, engine, tolerances=None, step_hz=1, min_interval=0.2,
+                 max_interval=2.0, idle_interval=5.0, min_elevation=0.0):
+        self.engine = engine
+        self.tolerances = dict(MODE_TOLERANCE_HZ, **(tolerances or {}))
+        self.step_hz = step_hz
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.idle_interval = idle_interval
+        self.min_elevation = min_elevation
+
+    def tolerance(self, mode):
+        return self.tolerances.get((mode or "").upper(), DEFAULT_TOLERANCE_HZ)
+
+    def is_visible(self, t):
+        return self.engine.elevation(t) >= self.min_elevation
+
+    def needs_write(self, last_freq, new_freq):
+        """Only retune when the change is at least one tuning step."""
+        return last_freq is None or abs(new_freq - last_freq) >= self.step_hz
+
+    def next_interval(self, carriers, t):
+        """Seconds until the next update; ``carriers`` is a list of (F0, mode)."""
+        if not self.is_visible(t):
+            return self.idle_interval
+        interval = self.max_interval
+        for F0, mode in carriers:
+            if not F0:
+                continue
+            rate = abs(self.engine.doppler_rate(F0, t))
+            if rate > 0:
+                interval = min(interval, self.tolerance(mode) / rate)
+        return max(self.min_interval, interval)
+
+
 if __name__ == "__main__":
+    import ephem
+
     # Example usage
     doppler_calculator = DopplerCalculator()
 
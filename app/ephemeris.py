@@ -0,0 +1,97 @@
+import time
+
+import numpy as np
+from skyfield.api import EarthSatellite, wgs84
+
+from sattrack import HORIZON_DEGREES, get_timescale
+
+
+class EphemerisService:
+    """The single SGP4 propagator for one satellite and one observer.
+
+    Doppler tables, pass prediction, the tracker readout and the map's
+    current position all come from here, so every consumer sees the same
+    numbers for the same instant. ``current()`` keeps the latest scalar
+    state and re-evaluates it at most once per ``max_age`` seconds no
+    matter how many consumers ask.
+    """
+
+    def __init__(self, tle, lat, lon, alt_m=0.0, ts=None):
+        self.ts = ts or get_timescale()
+        self.lat = lat
+        self.lon = lon
+        self.alt_m = alt_m
+        self.observer = wgs84.latlon(lat, lon, elevation_m=alt_m)
+        self.set_tle(tle)
+
+    def set_tle(self, tle):
+        self.tle = tle
+        self.satellite = EarthSatellite(tle[1], tle[2], tle[0], self.ts)
+        self.latest = None
+
+    def times(self, unix_times):
+        # Unix time has no leap seconds: split into whole days and seconds of
+        # the day rather than handing Skyfield seconds since 1970.
+        days, seconds = np.divmod(unix_times, 86400.0)
+        return self.ts.utc(1970, 1, 1 + days.astype(int), 0, 0, seconds)
+
+    def evaluate(self, unix_times):
+        """Position, az/el, range and range-rate for an array of unix times.
+
+        One vectorized SGP4 call; the topocentric values are derived from the
+        same geocentric position as the subpoint.
+        """
+        unix_times = np.asarray(unix_times, dtype=float)
+        t = self.times(unix_times)
+        geocentric = self.satellite.at(t)
+        topocentric = geocentric - self.observer.at(t)
+        el, az, distance, _, _, range_rate = topocentric.frame_latlon_and_rates(self.observer)
+        lat, lon = wgs84.latlon_of(geocentric)
+        return {
+            "time": unix_times,
+            "az": az.degrees,
+            "el": el.degrees,
+            "range_km": distance.km,
+            "range_rate": range_rate.km_per_s * 1000.0,  # m/s, positive receding
+            "lat": lat.degrees,
+            "lon": lon.degrees,
+            "alt_km": wgs84.height_of(geocentric).km,
+        }
+
+    def state(self, t):
+        """Scalar state at unix time ``t``; also becomes the ``latest`` state."""
+        values = self.evaluate([t])
+        state = {key: float(value[0]) for key, value in values.items()}
+        self.latest = state
+        return state
+
+    def current(self, now=None, max_age=1.0):
+        """The latest state, re-evaluated only if it is more than ``max_age`` seconds old."""
+        now = now or time.time()
+        latest = self.latest
+        if latest is not None and abs(now - latest["time"]) <= max_age:
+            return latest
+        return self.state(now)
+
+    def sample(self, start, end, step_seconds):
+        """Range-rate (m/s) and elevation (deg) at ``step_seconds`` intervals between two unix times."""
+        times = np.arange(start, end + step_seconds, step_seconds)
+        values = self.evaluate(times)
+        return times, values["range_rate"], values["el"]
+
+    def next_pass(self, t, hours=24, lookback_seconds=30 * 60):
+        """(aos, los) unix times of the pass in progress at, or next after, ``t``, or None."""
+        start = t - lookback_seconds
+        times, events = self.satellite.find_events(
+            self.observer, self.times(np.float64(start)), self.times(np.float64(t + hours * 3600)),
+            altitude_degrees=HORIZON_DEGREES)
+        aos = None
+        for when, event in zip(times.utc_datetime(), events):
+            when = when.timestamp()
+            if event == 0:
+                aos = when
+            elif event == 2:
+                if when >= t:
+                    return (aos if aos is not None else start, when)
+                aos = None
+        return None
@@ -1,65 +1,47 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
-from skyfield.api import load, EarthSatellite, utc
-from datetime import datetime, timedelta
+from skyfield.api import EarthSatellite, utc, wgs84
+from sattrack import get_timescale
+from metrics import MAP_RENDER_SECONDS
+from datetime import datetime
 import threading
 import time
-import matplotlib.image as mpimg
 import io
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
 
 
-class SatelliteTrackPlotter:
-    def __init__(self, tle_lines, output_file="satellite_track.png"):
-        self.tle_lines = tle_lines
-        self.name = tle_lines[0]
-        self.output_file = output_file
-        self.ts = load.timescale()
-        self.satellite = EarthSatellite(tle_lines[1], tle_lines[2], tle_lines[0], ts=self.ts)
+MAP_IMAGE = './app/map/world_map5.jpg'
 
 
-    # Fix for long line across dateline
-    def split_track_on_wraparound(self, lons, lats):
-        segments = []
-        segment = [(lons[0], lats[0])]
-        for lon, lat in zip(lons[1:], lats[1:]):
-            if abs(lon - segment[-1][0]) > 180:
-                segments.append(segment)
-                segment = [(lon, lat)]
-            else:
-                segment.append((lon, lat))
-        segments.append(segment)
-        return segments
-    
+class BaseMapLayer:
+    """Projection and background raster rendered once and reused for every map.
 
-    def compute_footprint_radius(self, altitude_km):
-        earth_radius_km = 6371
-        return np.sqrt((earth_radius_km + altitude_km)**2 - earth_radius_km**2)
-
-    def draw_footprint(self, m, center_lat, center_lon, radius_km=2200):
-        """
-        Draws only the footprint outline (no background fill).
-        """
-        angles = np.linspace(0, 360, 100)
-        lats = []
-        lons = []
+    Each render restores the cached background pixels, draws only the
+    overlay artists on top and encodes the result, so neither the Basemap
+    projection nor the background image is rebuilt per request.
 
-        for angle in angles:
-            angle_rad = np.deg2rad(angle)
-            dlat = (radius_km / 111) * np.cos(angle_rad)
-            dlon = (radius_km / (111 * np.cos(np.radians(center_lat)))) * np.sin(angle_rad)
-            lats.append(center_lat + dlat)
-            lons.append(center_lon + dlon)
+    matplotlib and Basemap are imported here rather than at module level,
+    so importing maptracker (for the JSON ground track) stays cheap and the
+    plotting stack only loads on the first /satmap render.
+    """
 
-        x, y = m(lons, lats)
+    def __init__(self, image_path=MAP_IMAGE, figsize=(12.64, 6.32), dpi=100):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+        from matplotlib.figure import Figure
+        from mpl_toolkits.basemap import Basemap
 
-        # Only draw border — no fill
-        plt.plot(x, y, linestyle='--', color='yellow', linewidth=1.5, alpha=0.9)
+        self.fig = Figure(figsize=figsize, dpi=dpi)
+        self.canvas = FigureCanvas(self.fig)
+        self.ax = self.fig.add_axes([0, 0, 1, 1])  # <- key line: use full canvas
+        self.m = Basemap(projection='mill', lat_0=0, lon_0=0, resolution='c', ax=self.ax)
+        self.plot_background_image(self.m, self.ax, image_path)
 
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.lock = threading.Lock()
 
     def plot_background_image(self, m, ax, image_path):
+        import matplotlib.image as mpimg
+
         img = mpimg.imread(image_path)
         # map corners (in lon/lat)
         llcrnrlon, llcrnrlat = -180, -90
@@ -70,73 +52,236 @@ class SatelliteTrackPlotter:
         x1, y1 = m(urcrnrlon, urcrnrlat)
 
         ax.imshow(img, extent=[x0, x1, y0, y1], aspect='auto', zorder=0)
-        
 
+    def render(self, draw_overlays):
+        """Render ``draw_overlays(m, ax)`` onto a copy of the base and return a PNG stream."""
+        import matplotlib.image as mpimg
+
+        with self.lock:
+            self.canvas.restore_region(self.background)
+            artists = draw_overlays(self.m, self.ax)
+            try:
+                for artist in artists:
+                    self.ax.draw_artist(artist)
+                buf = io.BytesIO()
+                mpimg.imsave(buf, np.asarray(self.canvas.buffer_rgba()), format='png',
+                             pil_kwargs={'compress_level': 1})
+            finally:
+                for artist in artists:
+                    artist.remove()
 
+        buf.seek(0)
+        return buf
 
-    def plot_track(self, duration_minutes=90, interval_seconds=60):
-        # Generate time range
-        #times = self.ts.utc(datetime.utcnow() + timedelta(seconds=i) for i in range(0, duration_minutes * 60, interval_seconds))
-        times = [self.ts.utc((datetime.now(utc) + timedelta(seconds=i))) for i in range(0, duration_minutes * 60, interval_seconds)]
-        subpoints = [self.satellite.at(t).subpoint() for t in times]
 
-        lats = [sp.latitude.degrees for sp in subpoints]
-        lons = [sp.longitude.degrees for sp in subpoints]
+_base_layer = None
+_base_layer_lock = threading.Lock()
 
-        # Set up map
-        fig = plt.figure(figsize=(12.64, 6.32), dpi=100)
-        #ax = plt.gca()
-        ax = fig.add_axes([0, 0, 1, 1])  # <- key line: use full canvas
 
-        m = Basemap(projection='mill', lat_0=0, lon_0=0, resolution='c', ax=ax)
-        self.plot_background_image(m, ax, './app/map/world_map5.jpg')
+def get_base_layer():
+    """Return the shared BaseMapLayer, building it on first use."""
+    global _base_layer
+    with _base_layer_lock:
+        if _base_layer is None:
+            _base_layer = BaseMapLayer()
+        return _base_layer
 
 
+class SatelliteTrackPlotter:
+    def __init__(self, tle_lines, output_file="satellite_track.png"):
+        self.tle_lines = tle_lines
+        self.name = tle_lines[0]
+        self.output_file = output_file
+        self.ts = get_timescale()
+        self.satellite = EarthSatellite(tle_lines[1], tle_lines[2], tle_lines[0], ts=self.ts)
+
+
+    # Fix for long line across dateline
+    def split_track_on_wraparound(self, lons, lats):
+        """Split a track into (lons, lats) array segments wherever it crosses the dateline."""
+        lons = np.asarray(lons)
+        lats = np.asarray(lats)
+        breaks = np.flatnonzero(np.abs(np.diff(lons)) > 180) + 1
+        return list(zip(np.split(lons, breaks), np.split(lats, breaks)))
+    
+
+    def compute_footprint_radius(self, altitude_km):
+        earth_radius_km = 6371
+        return np.sqrt((earth_radius_km + altitude_km)**2 - earth_radius_km**2)
+
+    def footprint_polygon(self, center_lat, center_lon, radius_km=2200, points=100):
+        """Return (lons, lats) arrays outlining the footprint around the subpoint."""
+        angles = np.deg2rad(np.linspace(0, 360, points))
+        lats = center_lat + (radius_km / 111) * np.cos(angles)
+        lons = center_lon + (radius_km / (111 * np.cos(np.radians(center_lat)))) * np.sin(angles)
+        return lons, lats
+
+    def draw_footprint(self, m, center_lat, center_lon, radius_km=2200):
+        """
+        Draws only the footprint outline (no background fill).
+        """
+        lons, lats = self.footprint_polygon(center_lat, center_lon, radius_km)
+        x, y = m(lons, lats)
+
+        # Only draw border — no fill
+        if m.ax is None:
+            import matplotlib.pyplot as plt
+            m.ax = plt.gca()
+        ax = m.ax
+        return ax.plot(x, y, linestyle='--', color='yellow', linewidth=1.5, alpha=0.9)
+
+    def ground_track(self, duration_minutes=90, interval_seconds=60, start=None):
+        """Subpoint lons/lats/heights over the track from a single vectorized at() call."""
+        start = start or datetime.now(utc)
+        seconds = np.arange(0, duration_minutes * 60, interval_seconds, dtype=float)
+        times = self.ts.utc(start.year, start.month, start.day, start.hour, start.minute,
+                            start.second + start.microsecond / 1e6 + seconds)
+        geocentric = self.satellite.at(times)
+        lat, lon = wgs84.latlon_of(geocentric)
+        height = wgs84.height_of(geocentric)
+        return lon.degrees, lat.degrees, height.km
+
+
+    def track_data(self, duration_minutes=90, interval_seconds=60, precision=2, state=None):
+        """Ground track, subpoint and footprint as compact JSON-ready lists.
+
+        Track and footprint are split at the dateline and given as lists of
+        [lon, lat] segments, so a client can draw them without any
+        projection math beyond an equirectangular mapping. When an
+        EphemerisService ``state`` is given the track starts from it, so the
+        map shows the same position as the Doppler loop and tracker.
+        """
+        lons, lats, heights = self.ground_track(duration_minutes, interval_seconds)
+        if state is not None:
+            lons[0], lats[0], heights[0] = state["lon"], state["lat"], state["alt_km"]
+
+        def pack(segments):
+            return [np.round(np.column_stack(seg), precision).tolist() for seg in segments]
+
+        radius_km = self.compute_footprint_radius(heights[0])
+        fp_lons, fp_lats = self.footprint_polygon(lats[0], lons[0], radius_km)
+        fp_lons = (fp_lons + 180) % 360 - 180
+        fp_lats = np.clip(fp_lats, -90, 90)
+
+        return {
+            "name": self.name,
+            "subpoint": {
+                "lon": round(float(lons[0]), precision),
+                "lat": round(float(lats[0]), precision),
+                "alt_km": round(float(heights[0]), 1),
+            },
+            "track": pack(self.split_track_on_wraparound(lons, lats)),
+            "footprint": pack(self.split_track_on_wraparound(fp_lons, fp_lats)),
+        }
+
+    def draw_overlays(self, m, ax, lons, lats, heights):
+        """Draw the track, footprint, marker and label; returns the new artists."""
+        artists = []
+
         # Plot satellite track
         segments = self.split_track_on_wraparound(lons, lats)
-        for seg in segments:
-            lon_seg, lat_seg = zip(*seg)
+        for lon_seg, lat_seg in segments:
             x, y = m(lon_seg, lat_seg)
-            m.plot(x, y, color='cyan', linewidth=2)
+            artists += ax.plot(x, y, color='cyan', linewidth=2)
 
         # Mark current satellite position
-        now_pos = self.satellite.at(self.ts.utc(datetime.now(utc))).subpoint()
-        now_lat, now_lon = now_pos.latitude.degrees, now_pos.longitude.degrees
+        now_lat, now_lon = lats[0], lons[0]
         x_now, y_now = m(now_lon, now_lat)
 
         # Draw footprint (approximate)
         #self.draw_footprint(m, now_lat, now_lon, radius_km=2200)
-        altitude_km = now_pos.elevation.km
+        altitude_km = heights[0]
         radius_km = self.compute_footprint_radius(altitude_km)
-        self.draw_footprint(m, now_lat, now_lon, radius_km=radius_km)
-
-        m.plot(x_now, y_now, 'yo', markersize=8)  # yellow dot
-
-        plt.text(x_now + 150000, y_now + 150000, self.name, 
-            color='yellow', fontsize=10, fontweight='bold')
-
+        artists += self.draw_footprint(m, now_lat, now_lon, radius_km=radius_km)
 
-        #plt.title("Satellite Ground Track")
-        #plt.savefig(self.output_file, dpi=100, bbox_inches='tight', pad_inches=0)
+        artists += ax.plot(x_now, y_now, 'yo', markersize=8)  # yellow dot
 
-        #plt.close()
-        print(f"Satellite track image saved to {self.output_file}")
+        artists.append(ax.text(x_now + 150000, y_now + 150000, self.name,
+            color='yellow', fontsize=10, fontweight='bold'))
+        return artists
 
-        buf = io.BytesIO()
-        fig.savefig(buf, format='png', dpi=100, bbox_inches='tight', pad_inches=0)
-        plt.close(fig)
-
-        buf.seek(0)
-        return buf
-
-    def start_auto_refresh(self, interval_seconds=60):
+    def plot_track(self, duration_minutes=90, interval_seconds=60):
+        # Generate the whole track in one vectorized call; the first sample is "now"
+        lons, lats, heights = self.ground_track(duration_minutes, interval_seconds)
+
+        # Only the overlays are drawn per call, on top of the cached base map
+        layer = get_base_layer()
+        return layer.render(lambda m, ax: self.draw_overlays(m, ax, lons, lats, heights))
+
+
+class MapRenderCache:
+    """Time-bucketed cache of rendered /satmap PNGs.
+
+    Renders are keyed by (satellite, TLE epoch, time bucket), so any number
+    of viewers cost one render per ``interval_seconds``. A background worker
+    (see ``start_auto_refresh``) renders each bucket ahead of the requests;
+    a request that arrives first renders it inline, once.
+    """
+
+    def __init__(self, interval_seconds=10, duration_minutes=180, step_seconds=60):
+        self.interval_seconds = interval_seconds
+        self.duration_minutes = duration_minutes
+        self.step_seconds = step_seconds
+        self.entry = None
+        self.plotter = None
+        self.lock = threading.Lock()
+        self.plotter_lock = threading.Lock()
+        self.thread = None
+
+    def key_for(self, tle, now=None):
+        now = now or time.time()
+        return (tle[0].strip(), tle[1][18:32], int(now // self.interval_seconds))
+
+    def plotter_for(self, tle):
+        """Return the SatelliteTrackPlotter for ``tle``, rebuilding it only when the TLE changes."""
+        with self.plotter_lock:
+            if self.plotter is None or self.plotter.tle_lines != tle:
+                self.plotter = SatelliteTrackPlotter(tle)
+            return self.plotter
+
+    def get(self, tle):
+        """Return the cached entry for ``tle``, rendering it if this bucket is missing.
+
+        An entry is a dict with "png" bytes, an "etag" and its "last_modified" time.
+        """
+        key = self.key_for(tle)
+        with self.lock:
+            if self.entry is not None and self.entry["key"] == key:
+                return self.entry
+
+            plotter = self.plotter_for(tle)
+            started = time.perf_counter()
+            png = plotter.plot_track(duration_minutes=self.duration_minutes,
+                                     interval_seconds=self.step_seconds).getvalue()
+            MAP_RENDER_SECONDS.observe(time.perf_counter() - started)
+            self.entry = {
+                "key": key,
+                "png": png,
+                "etag": f"{key[0]}-{key[1].strip()}-{key[2]}".replace(" ", "_"),
+                "last_modified": datetime.now(utc),
+            }
+            return self.entry
+
+    def start_auto_refresh(self, get_tle):
+        """Render every new bucket in the background for the TLE returned by ``get_tle()``.
+
+        Safe to call repeatedly; only one worker is ever started.
+        """
         def update_loop():
             while True:
-                self.plot_track()
-                time.sleep(interval_seconds)
+                tle = get_tle()
+                if tle and len(tle) >= 3:
+                    try:
+                        self.get(tle)
+                    except Exception as e:
+                        print(f"Map render failed: {e}")
+                time.sleep(self.interval_seconds - time.time() % self.interval_seconds)
 
-        thread = threading.Thread(target=update_loop, daemon=True)
-        thread.start()
+        with self.plotter_lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=update_loop, daemon=True)
+                self.thread.start()
+            return self.thread
 
 
 if __name__ == "__main__":
@@ -153,4 +298,3 @@ if __name__ == "__main__":
 
     tracker = SatelliteTrackPlotter(tle)
     tracker.plot_track(duration_minutes=180, interval_seconds=60)
-    #tracker.start_auto_refresh(interval_seconds=60)  # updates every 60 seconds
@@ -0,0 +1,218 @@
+"""Process-wide metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms are plain Python objects with their
+buckets allocated up front; recording a sample is a lock, a bisect and a
+couple of integer adds, cheap enough to leave on in production. Labelled
+children are created on first use and can be kept by the caller, so the
+hot paths never build label tuples per sample.
+"""
+import threading
+from bisect import bisect_left
+
+# Latency buckets in seconds: 1 ms .. 10 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Doppler loop tick durations and lateness are usually well under a millisecond
+TICK_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def escape_label(value):
+    """Label value escaped as the text format requires; session ids come from URLs."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class CounterChild:
+    def __init__(self, lock):
+        self.lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+
+class GaugeChild:
+    def __init__(self, lock):
+        self.lock = lock
+        self.value = 0.0
+
+    def set(self, value):
+        self.value = value
+
+
+class HistogramChild:
+    def __init__(self, lock, buckets):
+        self.lock = lock
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Metric:
+    kind = None
+    child_class = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.children = {}
+
+    def new_child(self):
+        return self.child_class(self.lock)
+
+    def labels(self, *values):
+        """Child for one label combination, created on first use."""
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self.new_child())
+        return child
+
+    def remove(self, *values):
+        with self.lock:
+            self.children.pop(values, None)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            yield self.name, format_labels(self.labelnames, values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{labels} {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+    child_class = CounterChild
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+    child_class = GaugeChild
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class CallbackMetric(Metric):
+    """Gauge or counter whose samples are read from ``collect()`` at scrape time.
+
+    For values another object already keeps (queue depths, read counts);
+    ``collect`` returns a list of (label values, value) pairs.
+    """
+
+    def __init__(self, name, documentation, labelnames, collect, kind="gauge"):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+        self.kind = kind
+
+    def samples(self):
+        for values, value in self.collect():
+            yield self.name, format_labels(self.labelnames, values), value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def new_child(self):
+        return HistogramChild(self.lock, self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def samples(self):
+        for values, child in list(self.children.items()):
+            with self.lock:
+                counts = list(child.counts)
+                total, count = child.sum, child.count
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames + ("le",), values + (format_value(bound),))
+                yield f"{self.name}_bucket", labels, cumulative
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def callback(self, name, documentation, labelnames, collect, kind="gauge"):
+        return self.register(CallbackMetric(name, documentation, labelnames, collect, kind))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+TICK_SECONDS = REGISTRY.histogram(
+    "pysattune_tick_duration_seconds", "Time spent in one Doppler loop tick.",
+    ["session"], TICK_BUCKETS)
+TICK_LATENESS_SECONDS = REGISTRY.histogram(
+    "pysattune_tick_lateness_seconds", "How late a Doppler tick started versus its schedule (jitter).",
+    ["session"], TICK_BUCKETS)
+TICK_ERRORS = REGISTRY.counter(
+    "pysattune_tick_errors_total", "Doppler ticks that raised an error.", ["session"])
+DOPPLER_ERROR_HZ = REGISTRY.gauge(
+    "pysattune_doppler_error_hz",
+    "Predicted Doppler at retune completion minus the Doppler that was sent.", ["session", "carrier"])
+RIG_COMMAND_SECONDS = REGISTRY.histogram(
+    "pysattune_rig_command_seconds", "rigctld round-trip time per command (batches joined with +).",
+    ["cmd"])
+RIG_ERRORS = REGISTRY.counter(
+    "pysattune_rig_errors_total", "Failed rigctld commands by kind (timeout, error, expired, rprt).",
+    ["kind"])
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "pysattune_http_request_seconds", "Flask request handling time per route.", ["route"])
+MAP_RENDER_SECONDS = REGISTRY.histogram(
+    "pysattune_map_render_seconds", "Time to render one /satmap PNG.")
@@ -0,0 +1,110 @@
+import os
+import glob
+import numpy as np
+
+CACHE_DIR = "doppler_cache"
+
+
+class PassPlanner:
+    """Precomputed per-pass Doppler tables with an on-disk .npy cache.
+
+    For each pass the range-rate and elevation are sampled every
+    ``step_seconds`` from shortly before AOS to shortly after LOS and saved
+    as one (3, N) array of [unix time, range-rate m/s, elevation deg]. Files
+    are keyed by NORAD ID, TLE epoch, observer and AOS and memory-mapped on
+    load, so restarting mid-pass picks the table straight back up. Passes
+    and samples both come from the session's EphemerisService. Building a
+    table prunes this satellite's and observer's tables for earlier passes
+    and for older TLE epochs.
+    """
+
+    def __init__(self, ephemeris, cache_dir=CACHE_DIR, step_seconds=0.5, margin_seconds=60):
+        self.ephemeris = ephemeris
+        self.cache_dir = cache_dir
+        self.step_seconds = step_seconds
+        self.margin_seconds = margin_seconds
+        self.reset()
+
+    def reset(self):
+        """Forget the current pass, e.g. after the ephemeris switched TLE."""
+        self.next_pass = None
+        self.table = None
+
+    def prefix(self, epoch=None):
+        tle = self.ephemeris.tle
+        norad_id = tle[1][2:7].strip()
+        epoch = epoch or tle[1][18:32].strip()
+        observer = f"{self.ephemeris.lat:.4f}_{self.ephemeris.lon:.4f}_{float(self.ephemeris.alt_m):.0f}"
+        return f"{norad_id}_{epoch}_{observer}"
+
+    def prune(self, start):
+        """Delete tables of passes before ``start`` and of other TLE epochs."""
+        current = self.prefix()
+        for path in glob.glob(os.path.join(self.cache_dir, f"{self.prefix('*')}_*.npy")):
+            prefix, _, cached_start = os.path.basename(path)[:-4].rpartition("_")
+            try:
+                stale = prefix != current or int(cached_start) < start - 60
+            except ValueError:
+                continue
+            if stale:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def find_pass(self, engine, t):
+        """(start, end) unix times of the table for the pass in progress at, or next after, ``t``."""
+        if self.next_pass is not None and t <= self.next_pass[1]:
+            return self.next_pass
+
+        span = self.ephemeris.next_pass(t - self.margin_seconds)
+        if span is None:
+            return None
+        self.next_pass = (span[0] - self.margin_seconds, span[1] + self.margin_seconds)
+        return self.next_pass
+
+    def path_for(self, start):
+        return os.path.join(self.cache_dir, f"{self.prefix()}_{int(start)}.npy")
+
+    def load(self, start):
+        """Load a cached table for the pass starting near ``start`` (AOS times jitter slightly)."""
+        for path in glob.glob(os.path.join(self.cache_dir, f"{self.prefix()}_*.npy")):
+            try:
+                cached_start = int(path.rsplit("_", 1)[1][:-4])
+            except ValueError:
+                continue
+            if abs(cached_start - start) <= 60:
+                return np.load(path, mmap_mode='r')
+        return None
+
+    def build(self, engine, start, end):
+        times, rates, elevations = engine.sample(start, end, self.step_seconds)
+        table = np.vstack([times, rates, elevations])
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            np.save(self.path_for(start), table)
+        except OSError as e:
+            print(f"Could not save Doppler table: {e}")
+        self.prune(start)
+        return table
+
+    def table_for(self, engine, t):
+        """Return the (3, N) table covering ``t``, building and caching it if needed.
+
+        Returns None when ``t`` is outside any pass.
+        """
+        if self.table is not None and self.table[0, 0] <= t <= self.table[0, -1]:
+            return self.table
+        span = self.find_pass(engine, t)
+        if span is None or t < span[0]:
+            return None
+        table = self.load(span[0])
+        if table is None:
+            table = self.build(engine, *span)
+        self.table = table
+        return table
+
+    def next_start(self, engine, t):
+        """Unix time the next pass table starts, or None."""
+        span = self.find_pass(engine, t)
+        return span[0] if span is not None else None
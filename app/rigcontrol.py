@@ -1,19 +1,104 @@
+import asyncio
 import socket
+import threading
+import time
+from collections import deque
 
-class RigCtlClient:
-    def __init__(self, host='localhost', port=4532):
-        self.host = host
-        self.port = port
+from metrics import RIG_COMMAND_SECONDS, RIG_ERRORS
+
+# Number of response lines rigctld returns for each "get" command in the
+# default (non-extended) protocol. "set" commands answer with one RPRT line.
+RESPONSE_LINES = {
+    "f": 1,
+    "m": 2,
+    "i": 1,
+    "x": 2,
+    "s": 2,
+    "t": 1,
+    "v": 1,
+}
+
+# Writes where only the newest value matters: a queued F/I (or a queued
+# F+I retune batch) is replaced in place by a newer one.
+COALESCED_COMMANDS = {"F", "I"}
+# Operator actions that jump ahead of Doppler writes and reads.
+PRIORITY_COMMANDS = {"M", "X", "T"}
+
+RIG_TIMEOUTS = RIG_ERRORS.labels("timeout")
+RIG_FAILURES = RIG_ERRORS.labels("error")
+RIG_EXPIRED = RIG_ERRORS.labels("expired")
+RIG_REJECTED = RIG_ERRORS.labels("rprt")
+_command_timers = {}
+
+
+def command_timer(names):
+    """RTT histogram child for a command (or batch) name tuple, cached per tuple."""
+    timer = _command_timers.get(names)
+    if timer is None:
+        timer = _command_timers[names] = RIG_COMMAND_SECONDS.labels("+".join(names))
+    return timer
+
+
+def rejected(result):
+    """True if any reply in an exchange carried a non-zero RPRT code."""
+    for reply in result:
+        if isinstance(reply, dict):
+            if reply["rprt"]:
+                return True
+        elif reply.startswith("RPRT -"):
+            return True
+    return False
 
-    def send_cmd(self, cmd):
-        """Send command to rigctld and return the response."""
-        try:
-            with socket.create_connection((self.host, self.port), timeout=3) as sock:
-                sock.sendall((cmd + '\n').encode())
-                response = sock.recv(1024).decode().strip()
-                return response
-        except Exception as e:
-            return f"Error: {e}"
+
+def response_parser(cmd):
+    """Parse one default-protocol response fed line by line via send().
+
+    Yields until the expected value lines (or a single RPRT line) have
+    been received and returns them joined, the same as the old recv() text.
+    """
+    name = cmd.split(" ", 1)[0]
+    expected = RESPONSE_LINES.get(name, 1)
+    lines = []
+    while len(lines) < expected:
+        line = yield
+        if line.startswith("RPRT"):
+            if not lines:
+                lines.append(line)
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def extended_parser(cmd):
+    """Parse one extended-protocol record, which always ends with an RPRT line."""
+    result = {"cmd": cmd, "values": {}, "rprt": None, "error": None}
+    yield  # echoed command name, e.g. "set_freq: 145990000"
+    while True:
+        line = yield
+        if line.startswith("RPRT"):
+            result["rprt"] = int(line.split()[1])
+            if result["rprt"] != 0:
+                result["error"] = line
+            return result
+        key, sep, value = line.partition(":")
+        if sep and value.strip():
+            result["values"][key.strip()] = value.strip()
+
+
+def batch_payload(cmds):
+    return "".join(f"+{cmd}\n" for cmd in cmds).encode()
+
+
+def batch_error(cmds, e):
+    return [{"cmd": cmd, "values": {}, "rprt": None, "error": f"Error: {e}"} for cmd in cmds]
+
+
+class RigCommands:
+    """rigctld command helpers shared by the blocking and asyncio clients.
+
+    Each helper returns whatever ``send_cmd``/``send_batch`` return, so on
+    AsyncRigCtlClient they are awaitable.
+    """
 
     def get_freq(self):
         return self.send_cmd("f")
@@ -33,10 +118,6 @@ class RigCtlClient:
     def ptt_off(self):
         return self.send_cmd("T 0")
     
-    def set_split(self):
-        self.send_cmd(f"S 1 VFOA")
-        return self.send_cmd(f"S 1 VFOB")
-    
     def reset_split(self):
         return self.send_cmd(f"S 0 VFOA")
     
@@ -45,7 +126,420 @@ class RigCtlClient:
     
     def set_split_mode(self, mode, passband=1):
         return self.send_cmd(f"X {mode} {passband}")
-    
+
+    def retune(self, rx_freq, tx_freq):
+        """Set the RX and TX split frequencies in a single round-trip."""
+        return self.send_batch([f"F {rx_freq}", f"I {tx_freq}"])
+
+
+class RigCtlClient(RigCommands):
+    def __init__(self, host='localhost', port=4532, timeout=3):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sock = None
+        self._rfile = None
+        self._lock = threading.RLock()
+
+    def connect(self):
+        """Open the persistent connection to rigctld if it is not already open."""
+        with self._lock:
+            if self._sock is None:
+                self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._rfile = self._sock.makefile('rb')
+
+    def close(self):
+        """Drop the connection; the next command reconnects."""
+        with self._lock:
+            if self._rfile is not None:
+                try:
+                    self._rfile.close()
+                except OSError:
+                    pass
+            if self._sock is not None:
+                try:
+                    self._sock.close()
+                except OSError:
+                    pass
+            self._sock = None
+            self._rfile = None
+
+    def _readline(self):
+        line = self._rfile.readline()
+        if not line:
+            raise ConnectionError("rigctld closed the connection")
+        return line.decode().strip()
+
+    def _read(self, parser):
+        next(parser)
+        try:
+            while True:
+                parser.send(self._readline())
+        except StopIteration as done:
+            return done.value
+
+    def _exchange(self, payload, cmds, extended=False):
+        self.connect()
+        self._sock.sendall(payload)
+        make_parser = extended_parser if extended else response_parser
+        return [self._read(make_parser(cmd)) for cmd in cmds]
+
+    def _transact(self, payload, cmds, extended=False):
+        """Run one exchange, retrying once if the kept-alive socket went stale."""
+        with self._lock:
+            reused = self._sock is not None
+            try:
+                return self._exchange(payload, cmds, extended)
+            except Exception as e:
+                self.close()
+                # A kept-alive socket may have gone stale (rigctld restarted);
+                # retry once on a fresh connection, but never after a timeout.
+                if not reused or isinstance(e, socket.timeout):
+                    raise
+            try:
+                return self._exchange(payload, cmds, extended)
+            except Exception:
+                self.close()
+                raise
+
+    def send_cmd(self, cmd):
+        """Send command to rigctld and return the response."""
+        try:
+            return self._transact((cmd + '\n').encode(), [cmd])[0]
+        except Exception as e:
+            return f"Error: {e}"
+
+    def send_batch(self, cmds):
+        """Pipeline several commands in one write using rigctld's extended protocol.
+
+        Returns one dict per command with the parsed "values", the "rprt"
+        code and an "error" string (None on success).
+        """
+        try:
+            return self._transact(batch_payload(cmds), cmds, extended=True)
+        except Exception as e:
+            return batch_error(cmds, e)
+
+    def set_split(self):
+        self.send_cmd(f"S 1 VFOA")
+        return self.send_cmd(f"S 1 VFOB")
+
+
+class QueuedCommand:
+    def __init__(self, payload, cmds, extended, future, deadline):
+        self.payload = payload
+        self.cmds = cmds
+        self.names = tuple(cmd.split(" ", 1)[0] for cmd in cmds)
+        self.extended = extended
+        self.futures = [future]
+        self.deadline = deadline
+
+    def done(self):
+        return all(future.done() for future in self.futures)
+
+
+class RigCommandQueue:
+    """Single-writer queue in front of one rig.
+
+    Mode/PTT commands are served before anything else. A frequency write
+    replaces a still-queued write of the same kind (last write wins) and
+    every caller of the superseded write receives the result of the one
+    actually sent, so at most one F, one I and one F+I batch are ever
+    waiting. Other commands queue FIFO up to ``max_pending``.
+    """
+
+    def __init__(self, max_pending=32):
+        self.max_pending = max_pending
+        self.high = deque()
+        self.normal = deque()
+        self.writes = {}
+        self.ready = asyncio.Event()
+        self.dropped_writes = 0
+        self.rejected = 0
+
+    def depth(self):
+        return len(self.high) + len(self.normal)
+
+    def drain(self):
+        """Remove and return every queued command."""
+        commands = list(self.high) + list(self.normal)
+        self.high.clear()
+        self.normal.clear()
+        self.writes.clear()
+        return commands
+
+    def put(self, command):
+        names = command.names
+        if all(name in COALESCED_COMMANDS for name in names):
+            pending = self.writes.get(names)
+            if pending is not None:
+                pending.payload = command.payload
+                pending.cmds = command.cmds
+                pending.deadline = command.deadline
+                pending.futures.extend(command.futures)
+                self.dropped_writes += 1
+                return
+            self.writes[names] = command
+        elif self.depth() >= self.max_pending:
+            self.rejected += 1
+            raise RuntimeError("rig command queue full")
+        if any(name in PRIORITY_COMMANDS for name in names):
+            self.high.append(command)
+        else:
+            self.normal.append(command)
+        self.ready.set()
+
+    async def get(self):
+        while not self.high and not self.normal:
+            self.ready.clear()
+            await self.ready.wait()
+        command = self.high.popleft() if self.high else self.normal.popleft()
+        for key, pending in list(self.writes.items()):
+            if pending is command:
+                del self.writes[key]
+        return command
+
+    def stats(self):
+        return {"depth": self.depth(), "dropped_writes": self.dropped_writes, "rejected": self.rejected}
+
+
+class AsyncRigCtlClient(RigCommands):
+    """asyncio rigctld client: one connection, a command queue and per-command deadlines.
+
+    Commands go through a RigCommandQueue and are written by a single
+    worker task, so callers on the event loop never block on the socket and
+    bursts of frequency writes collapse to the newest. Every command carries a
+    deadline; a command whose deadline expires while queued is dropped,
+    one that times out on the wire resets the connection, and a caller
+    that is cancelled simply has its queued command skipped. All helpers
+    are coroutines and return the same values as RigCtlClient.
+    """
+
+    def __init__(self, host='localhost', port=4532, timeout=3, max_pending=32):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._reader = None
+        self._writer = None
+        self._queue = None
+        self._worker = None
+        self._active = None
+        self._closed = False
+
+    async def connect(self):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            sock = self._writer.get_extra_info('socket')
+            if sock is not None:
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = None
+        self._writer = None
+
+    async def aclose(self):
+        """Shut the client down for good: stop the worker, fail queued commands, close the socket."""
+        self._closed = True
+        worker, self._worker = self._worker, None
+        if worker is not None:
+            worker.cancel()
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        commands = self._queue.drain() if self._queue is not None else []
+        if self._active is not None:
+            commands.append(self._active)
+            self._active = None
+        for command in commands:
+            self._resolve(command, error=ConnectionError("rig client closed"))
+        await self.close()
+
+    def pending(self):
+        """Number of commands waiting in the queue."""
+        return self._queue.depth() if self._queue is not None else 0
+
+    def stats(self):
+        """Queue depth plus coalesced (dropped) and rejected command counts."""
+        if self._queue is None:
+            return {"depth": 0, "dropped_writes": 0, "rejected": 0}
+        return self._queue.stats()
+
+    async def _readline(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("rigctld closed the connection")
+        return line.decode().strip()
+
+    async def _read(self, parser):
+        next(parser)
+        try:
+            while True:
+                parser.send(await self._readline())
+        except StopIteration as done:
+            return done.value
+
+    async def _exchange(self, payload, cmds, extended):
+        await self.connect()
+        self._writer.write(payload)
+        await self._writer.drain()
+        make_parser = extended_parser if extended else response_parser
+        return [await self._read(make_parser(cmd)) for cmd in cmds]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            command = await self._queue.get()
+            if command.done():
+                continue  # every caller gave up or was cancelled
+            started = loop.time()
+            remaining = command.deadline - started
+            if remaining <= 0:
+                RIG_EXPIRED.inc()
+                self._resolve(command, error=asyncio.TimeoutError("command expired in queue"))
+                continue
+            self._active = command  # failed by aclose() if it lands mid-exchange
+            try:
+                result = await asyncio.wait_for(
+                    self._exchange(command.payload, command.cmds, command.extended), remaining)
+            except Exception as e:
+                (RIG_TIMEOUTS if isinstance(e, asyncio.TimeoutError) else RIG_FAILURES).inc()
+                # The stream may hold a partial reply; start clean next time
+                await self.close()
+                self._resolve(command, error=e)
+            else:
+                command_timer(command.names).observe(loop.time() - started)
+                if rejected(result):
+                    RIG_REJECTED.inc()
+                self._resolve(command, result=result)
+            self._active = None
+
+    def _resolve(self, command, result=None, error=None):
+        for future in command.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    async def _submit(self, payload, cmds, extended, timeout):
+        if self._closed:
+            raise ConnectionError("rig client closed")
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = RigCommandQueue(self.max_pending)
+        if self._worker is None or self._worker.done():
+            self._worker = loop.create_task(self._run())
+        timeout = self.timeout if timeout is None else timeout
+        future = loop.create_future()
+        self._queue.put(QueuedCommand(payload, cmds, extended, future, loop.time() + timeout))
+        return await asyncio.wait_for(future, timeout)
+
+    async def send_cmd(self, cmd, timeout=None):
+        """Send command to rigctld and return the response."""
+        try:
+            return (await self._submit((cmd + '\n').encode(), [cmd], False, timeout))[0]
+        except asyncio.TimeoutError:
+            return "Error: timed out"
+        except Exception as e:
+            return f"Error: {e}"
+
+    async def send_batch(self, cmds, timeout=None):
+        """Pipeline several commands in one write using rigctld's extended protocol."""
+        try:
+            return await self._submit(batch_payload(cmds), cmds, True, timeout)
+        except asyncio.TimeoutError:
+            return batch_error(cmds, "timed out")
+        except Exception as e:
+            return batch_error(cmds, e)
+
+    async def set_split(self):
+        await self.send_cmd(f"S 1 VFOA")
+        return await self.send_cmd(f"S 1 VFOB")
+
+
+class RigShadow:
+    """Shadow copy of an AsyncRigCtlClient's VFO frequencies and modes.
+
+    Keeps the last commanded and last read value for the RX VFO ("rx"), the
+    split TX VFO ("tx") and their modes. A successful write also counts as
+    a read, since the rig now shows that value, so ``get_freq()`` answers
+    from the cache and only goes to the radio every ``poll_seconds`` to
+    catch the operator turning the dial.
+    """
+
+    def __init__(self, rig, poll_seconds=2.0):
+        self.rig = rig
+        self.poll_seconds = poll_seconds
+        self.freq = {"rx": {"commanded": None, "read": None}, "tx": {"commanded": None, "read": None}}
+        self.mode = {"rx": None, "tx": None}
+        self.read_at = None
+        self.reads = 0
+        self.cached_reads = 0
+
+    def _commanded(self, vfo, freq_hz):
+        self.freq[vfo]["commanded"] = freq_hz
+        self.freq[vfo]["read"] = freq_hz
+
+    async def get_freq(self, force=False):
+        """RX VFO frequency in Hz, read from the rig only when a poll is due."""
+        now = time.monotonic()
+        cached = self.freq["rx"]["read"]
+        # read_at only moves on real reads, so writes never postpone the
+        # dial poll; it is None until the first one.
+        due = self.read_at is None or now - self.read_at >= self.poll_seconds
+        if not force and cached is not None and not due:
+            self.cached_reads += 1
+            return cached
+        response = await self.rig.get_freq()
+        try:
+            freq_hz = int(response)
+        except ValueError:
+            raise ConnectionError(f"Frequency read failed: {response}")
+        self.freq["rx"]["read"] = freq_hz
+        self.read_at = now
+        self.reads += 1
+        return freq_hz
+
+    async def set_freq(self, freq_hz):
+        response = await self.rig.set_freq(freq_hz)
+        if response == "RPRT 0":
+            self._commanded("rx", freq_hz)
+        return response
+
+    async def retune(self, rx_freq, tx_freq):
+        results = await self.rig.retune(rx_freq, tx_freq)
+        for vfo, freq_hz, result in zip(("rx", "tx"), (rx_freq, tx_freq), results):
+            if result["rprt"] == 0:
+                self._commanded(vfo, freq_hz)
+        return results
+
+    async def set_mode(self, mode="USB", passband=1):
+        response = await self.rig.set_mode(mode, passband)
+        if response == "RPRT 0":
+            self.mode["rx"] = mode
+        return response
+
+    async def set_split_mode(self, mode, passband=1):
+        response = await self.rig.set_split_mode(mode, passband)
+        if response == "RPRT 0":
+            self.mode["tx"] = mode
+        return response
+
+    def stats(self):
+        return {"reads": self.reads, "cached_reads": self.cached_reads}
+
+
 if __name__ == "__main__":
     rig = RigCtlClient()
 
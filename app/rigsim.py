@@ -0,0 +1,241 @@
+"""rigctld-compatible TCP simulator for load-testing the rig control path.
+
+Each VirtualRadio keeps VFO A/B frequency and mode, split and PTT state
+and answers the commands RigCtlClient uses (f F m M s S i I x X t T) in
+both the default and the "+" extended protocol. A radio models its CAT
+bus: commands from all of its connections are serialized, each costing
+``latency`` plus the bytes on the wire at ``baud``. Faults can be
+injected: swallowed replies (client timeouts), dropped connections and
+operator dial changes.
+
+    python app/rigsim.py --radios 8 --base-port 4532 --latency 0.02 --baud 19200
+"""
+import argparse
+import asyncio
+import random
+import threading
+
+# Hamlib error codes as rigctld reports them ("RPRT -n")
+RIG_OK = 0
+RIG_EINVAL = -1
+RIG_ENIMPL = -4
+
+VFOS = ("VFOA", "VFOB")
+
+
+class VirtualRadio:
+    """State and CAT bus model of one simulated transceiver."""
+
+    def __init__(self, name="IC-705", freq_hz=145990000, latency=0.0, baud=None,
+                 timeout_rate=0.0, drop_rate=0.0, dial_every=None, dial_step_hz=500, seed=None):
+        self.name = name
+        self.freq = {"VFOA": freq_hz, "VFOB": freq_hz}
+        self.mode = {"VFOA": ("FM", 15000), "VFOB": ("FM", 15000)}
+        self.split = False
+        self.tx_vfo = "VFOA"
+        self.ptt = False
+        self.latency = latency
+        self.baud = baud
+        self.timeout_rate = timeout_rate
+        self.drop_rate = drop_rate
+        self.dial_every = dial_every
+        self.dial_step_hz = dial_step_hz
+        self.random = random.Random(seed)
+        self.bus = None
+        self.stats = {"commands": 0, "timeouts": 0, "drops": 0, "dial_changes": 0, "errors": 0}
+
+    @property
+    def tx_freq_vfo(self):
+        return self.tx_vfo if self.split else "VFOA"
+
+    def turn_dial(self, delta_hz):
+        """Simulate the operator turning the main dial."""
+        self.freq["VFOA"] += delta_hz
+        self.stats["dial_changes"] += 1
+
+    def bus_delay(self, request, reply):
+        """Seconds the CAT bus is busy for one command and its reply."""
+        delay = self.latency
+        if self.baud:
+            delay += (len(request) + len(reply)) * 10 / self.baud  # 8N1
+        return delay
+
+    def execute(self, cmd, args):
+        """Run one command; returns (long name, [(key, value)], RPRT code)."""
+        self.stats["commands"] += 1
+        try:
+            if cmd == "f":
+                return "get_freq", [("Frequency", self.freq["VFOA"])], RIG_OK
+            if cmd == "F":
+                self.freq["VFOA"] = int(float(args[0]))
+                return "set_freq", [], RIG_OK
+            if cmd == "m":
+                mode, passband = self.mode["VFOA"]
+                return "get_mode", [("Mode", mode), ("Passband", passband)], RIG_OK
+            if cmd == "M":
+                self.mode["VFOA"] = (args[0], int(args[1]) if len(args) > 1 else 0)
+                return "set_mode", [], RIG_OK
+            if cmd == "i":
+                return "get_split_freq", [("TX Frequency", self.freq[self.tx_freq_vfo])], RIG_OK
+            if cmd == "I":
+                self.freq[self.tx_freq_vfo] = int(float(args[0]))
+                return "set_split_freq", [], RIG_OK
+            if cmd == "x":
+                mode, passband = self.mode[self.tx_freq_vfo]
+                return "get_split_mode", [("TX Mode", mode), ("TX Passband", passband)], RIG_OK
+            if cmd == "X":
+                self.mode[self.tx_freq_vfo] = (args[0], int(args[1]) if len(args) > 1 else 0)
+                return "set_split_mode", [], RIG_OK
+            if cmd == "s":
+                return "get_split_vfo", [("Split", int(self.split)), ("TX VFO", self.tx_vfo)], RIG_OK
+            if cmd == "S":
+                if args[1] not in VFOS:
+                    return "set_split_vfo", [], RIG_EINVAL
+                self.split = args[0] == "1"
+                self.tx_vfo = args[1]
+                return "set_split_vfo", [], RIG_OK
+            if cmd == "t":
+                return "get_ptt", [("PTT", int(self.ptt))], RIG_OK
+            if cmd == "T":
+                self.ptt = args[0] == "1"
+                return "set_ptt", [], RIG_OK
+        except (IndexError, ValueError):
+            self.stats["errors"] += 1
+            return cmd, [], RIG_EINVAL
+        self.stats["errors"] += 1
+        return cmd, [], RIG_ENIMPL
+
+
+def format_reply(line, name, values, rprt, extended):
+    if extended:
+        args = line.split(" ", 1)[1] if " " in line else ""
+        out = [f"{name}: {args}".rstrip()]
+        out += [f"{key}: {value}" for key, value in values]
+        out.append(f"RPRT {rprt}")
+    elif values and rprt == RIG_OK:
+        out = [str(value) for _, value in values]
+    else:
+        out = [f"RPRT {rprt}"]
+    return ("\n".join(out) + "\n").encode()
+
+
+class RigctldSimulator:
+    """Serves any number of VirtualRadios, one TCP port each, from one event loop.
+
+    ``start()`` runs the loop in a daemon thread so tests and benchmarks can
+    embed the simulator; ``add_radio()`` returns the port it listens on.
+    """
+
+    def __init__(self, host="127.0.0.1"):
+        self.host = host
+        self.radios = {}
+        self.servers = []
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        """Close every port and client connection and stop the loop thread."""
+        if self.thread is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.thread = None
+
+    async def _shutdown(self):
+        for server in self.servers:
+            server.close()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def add_radio(self, radio, port=0):
+        """Start serving ``radio`` on ``port`` (0 picks a free one); returns the port."""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self._serve_radio(radio, port), self.loop)
+        port = future.result()
+        self.radios[port] = radio
+        return port
+
+    async def _serve_radio(self, radio, port):
+        radio.bus = asyncio.Lock()
+        server = await asyncio.start_server(
+            lambda reader, writer: self._client(radio, reader, writer), self.host, port)
+        self.servers.append(server)
+        if radio.dial_every:
+            self.loop.create_task(self._dial(radio))
+        return server.sockets[0].getsockname()[1]
+
+    async def _dial(self, radio):
+        while True:
+            await asyncio.sleep(radio.dial_every)
+            radio.turn_dial(radio.random.choice((-1, 1)) * radio.dial_step_hz)
+
+    async def _client(self, radio, reader, writer):
+        try:
+            while True:
+                request = await reader.readline()
+                if not request:
+                    break
+                line = request.decode().strip()
+                if not line:
+                    continue
+                if line in ("q", "Q"):
+                    break
+                if radio.random.random() < radio.drop_rate:
+                    radio.stats["drops"] += 1
+                    break
+                extended = line.startswith("+")
+                line = line.lstrip("+")
+                parts = line.split()
+                async with radio.bus:
+                    name, values, rprt = radio.execute(parts[0], parts[1:])
+                    reply = format_reply(line, name, values, rprt, extended)
+                    await asyncio.sleep(radio.bus_delay(request, reply))
+                if radio.random.random() < radio.timeout_rate:
+                    radio.stats["timeouts"] += 1
+                    continue  # the command ran but the answer never comes back
+                writer.write(reply)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        except asyncio.CancelledError:
+            pass  # simulator shutting down; end the handler quietly
+        finally:
+            writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulated rigctld radios")
+    parser.add_argument("--radios", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=4532)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per CAT command")
+    parser.add_argument("--baud", type=int, default=None, help="CAT bus speed, e.g. 19200")
+    parser.add_argument("--timeout-rate", type=float, default=0.0, help="fraction of replies swallowed")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="fraction of commands that drop the connection")
+    parser.add_argument("--dial-every", type=float, default=None, help="seconds between simulated dial turns")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    simulator = RigctldSimulator(args.host)
+    for i in range(args.radios):
+        radio = VirtualRadio(name=f"radio{i}", latency=args.latency, baud=args.baud,
+                             timeout_rate=args.timeout_rate, drop_rate=args.drop_rate,
+                             dial_every=args.dial_every,
+                             seed=None if args.seed is None else args.seed + i)
+        port = simulator.add_radio(radio, args.base_port + i)
+        print(f"{radio.name} listening on {args.host}:{port}")
+    try:
+        simulator.thread.join()
+    except KeyboardInterrupt:
+        for port, radio in simulator.radios.items():
+            print(f"{radio.name} ({port}): {radio.stats}")
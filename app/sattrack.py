@@ -1,69 +1,178 @@
 from skyfield.api import load, EarthSatellite, wgs84
 from datetime import datetime, timedelta, timezone
 import math
+import numpy as np
+import threading
+
+OBSERVER_LAT = 13.808596988865355
+OBSERVER_LON = 99.78500659188863
+PASS_COUNT = 5
+PASS_SEARCH_HOURS = 24
+HORIZON_DEGREES = 0.0  # AOS/LOS elevation, shared with EphemerisService.next_pass
+
+_timescale = None
+
+
+def get_timescale():
+    """Return the process-wide Skyfield timescale, loading it on first use."""
+    global _timescale
+    if _timescale is None:
+        _timescale = load.timescale()
+    return _timescale
+
 
 class SatelliteTracker:
-    def __init__(self, tle_name, tle_line1, tle_line2):
+    def __init__(self, tle_name, tle_line1, tle_line2, lat=OBSERVER_LAT, lon=OBSERVER_LON, alt_m=0.0,
+                 ts=None, satellite=None, observer=None):
         self.name = tle_name
-        self.ts = load.timescale()
-        self.satellite = EarthSatellite(tle_line1, tle_line2, tle_name, self.ts)
+        self.ts = ts or get_timescale()
+        self.satellite = satellite or EarthSatellite(tle_line1, tle_line2, tle_name, self.ts)
         #self.observer = wgs84.latlon()  # Example: Bangkok, Thailand
-        self.observer = wgs84.latlon(13.808596988865355, 99.78500659188863)
-        #13.808596988865355, 99.78500659188863
-
-    def get_tracking_info(self):
-        now = datetime.utcnow().replace(tzinfo=timezone.utc)
-        t = self.ts.utc(now)
-
-        # Current satellite position
-        geocentric = self.satellite.at(t)
-        subpoint = geocentric.subpoint()
-        sat_lat = subpoint.latitude.degrees
-        sat_lon = subpoint.longitude.degrees
-        sat_height_km = subpoint.elevation.km
-
-        difference = self.satellite - self.observer
-        topocentric = difference.at(t)
-        el, az, distance = topocentric.altaz()
-
-        # Compute next AOS and LOS
-        t0 = self.ts.utc(now)
-        t1 = self.ts.utc(now + timedelta(hours=12))
-        times, events = self.satellite.find_events(self.observer, t0, t1, altitude_degrees=1.0)
-
-        aos_time = los_time = None
-        aos_az = los_az = None
-        max_el_value = 0.0
-
-        for ti, event in zip(times, events):
-            if event == 0 and aos_time is None:
-                aos_time = ti
-                _, aos_az, _ = difference.at(ti).altaz()
-            if event == 2 and los_time is None:
-                los_time = ti
-                _, los_az, _ = difference.at(ti).altaz()
-                break  # We only consider the first AOS-LOS pair
-
-        # Sample max elevation between AOS and LOS
-        if aos_time is not None and los_time is not None:
-            start_dt = aos_time.utc_datetime()
-            end_dt = los_time.utc_datetime()
-            duration_seconds = (end_dt - start_dt).total_seconds()
-            steps = int(duration_seconds // 10)
-
-            for i in range(steps + 1):
-                ti = self.ts.utc(start_dt + timedelta(seconds=i * 10))
-                alt, _, _ = difference.at(ti).altaz()
-                if alt.degrees > max_el_value:
-                    max_el_value = alt.degrees
+        self.observer = observer or wgs84.latlon(lat, lon, elevation_m=alt_m)
+        self.difference = self.satellite - self.observer
+        self._passes = None
+        self._passes_valid_until = None
+        self._passes_lock = threading.Lock()
+
+    @classmethod
+    def for_ephemeris(cls, ephemeris):
+        """Tracker on an EphemerisService's satellite and observer, so its passes match the Doppler loop's."""
+        tle = ephemeris.tle
+        return cls(tle[0], tle[1], tle[2], ephemeris.lat, ephemeris.lon, ephemeris.alt_m,
+                   ts=ephemeris.ts, satellite=ephemeris.satellite, observer=ephemeris.observer)
+
+    def compute_passes(self, now, count=PASS_COUNT, hours=PASS_SEARCH_HOURS):
+        """Compute the next ``count`` passes starting at (or in progress at) ``now``.
+
+        Each pass is a dict with AOS/TCA/LOS datetimes, azimuths and the
+        maximum elevation. A pass already in progress when the search window
+        opens has ``aos`` set to None.
+        """
+        t0 = self.ts.utc(now - timedelta(hours=1))
+        t1 = self.ts.utc(now + timedelta(hours=hours))
+        times, events = self.satellite.find_events(self.observer, t0, t1, altitude_degrees=HORIZON_DEGREES)
+        if len(times) == 0:
+            return []
+
+        # One vectorized evaluation for every event time
+        alt, az, _ = self.difference.at(times).altaz()
+        alt_deg = alt.degrees.tolist()
+        az_deg = az.degrees.tolist()
+        times_dt = times.utc_datetime()
+
+        passes = []
+        current = None
+        for i, event in enumerate(events):
+            if event == 0:
+                current = {"aos": times_dt[i], "aos_az": az_deg[i]}
+            else:
+                if current is None:
+                    if i > 0:
+                        continue
+                    current = {"aos": None, "aos_az": None}
+                if event == 1:
+                    if alt_deg[i] > current.get("max_el", -90.0):
+                        current["tca"] = times_dt[i]
+                        current["tca_az"] = az_deg[i]
+                        current["max_el"] = alt_deg[i]
+                else:
+                    current["los"] = times_dt[i]
+                    current["los_az"] = az_deg[i]
+                    if current["los"] > now and "max_el" in current:
+                        passes.append(current)
+                        if len(passes) >= count:
+                            break
+                    current = None
+        return passes
+
+    def get_passes(self, now=None, count=PASS_COUNT):
+        """Return the cached pass schedule, recomputing it only when the first pass has ended."""
+        now = now or datetime.utcnow().replace(tzinfo=timezone.utc)
+        with self._passes_lock:
+            if self._passes is None or now >= self._passes_valid_until:
+                passes = self.compute_passes(now, count=count)
+                self._passes = passes
+                if passes:
+                    self._passes_valid_until = passes[0]["los"]
+                else:
+                    self._passes_valid_until = now + timedelta(minutes=10)
+            return [p for p in self._passes if p["los"] > now][:count]
+
+    def time_array(self, start, seconds):
+        """Build a Skyfield Time array at ``start`` + ``seconds`` (a NumPy array)."""
+        return self.ts.utc(start.year, start.month, start.day, start.hour, start.minute,
+                           start.second + start.microsecond / 1e6 + seconds)
+
+    def evaluate(self, times):
+        """Vectorized az/el/range/range-rate for a Skyfield Time array."""
+        topocentric = self.difference.at(times)
+        el, az, distance, _, _, range_rate = topocentric.frame_latlon_and_rates(self.observer)
+        return {
+            "az": az.degrees,
+            "el": el.degrees,
+            "range_km": distance.km,
+            "range_rate_km_s": range_rate.km_per_s,
+        }
+
+    def get_pass_profile(self, pass_info=None, step_seconds=1.0):
+        """Az/el/range/range-rate arrays over a whole pass from one vectorized call.
+
+        Defaults to the current or next cached pass. The TCA is refined to
+        0.1 s by re-sampling around the coarse elevation maximum.
+        """
+        if pass_info is None:
+            passes = self.get_passes()
+            if not passes:
+                return None
+            pass_info = passes[0]
+        start = pass_info["aos"] or pass_info["tca"] - (pass_info["los"] - pass_info["tca"])
+        duration = (pass_info["los"] - start).total_seconds()
+
+        seconds = np.arange(0.0, duration + step_seconds, step_seconds)
+        times = self.time_array(start, seconds)
+        profile = self.evaluate(times)
+
+        peak = int(np.argmax(profile["el"]))
+        fine_seconds = np.arange(seconds[peak] - step_seconds, seconds[peak] + step_seconds, 0.1)
+        fine_el = self.evaluate(self.time_array(start, fine_seconds))["el"]
+        fine_peak = int(np.argmax(fine_el))
+
+        profile.update({
+            "time": times,
+            "seconds": seconds,
+            "start": start,
+            "tca": start + timedelta(seconds=float(fine_seconds[fine_peak])),
+            "max_el": float(fine_el[fine_peak]),
+        })
+        return profile
+
+    def get_tracking_info(self, state=None):
+        """Readout for the UI.
+
+        ``state`` is an EphemerisService state dict; when given, the current
+        position is taken from it instead of propagating again.
+        """
+        if state is not None:
+            now = datetime.fromtimestamp(state["time"], timezone.utc)
+            az_deg, el_deg, range_km = state["az"], state["el"], state["range_km"]
+        else:
+            now = datetime.utcnow().replace(tzinfo=timezone.utc)
+            el, az, distance = self.difference.at(self.ts.utc(now)).altaz()
+            az_deg, el_deg, range_km = az.degrees, el.degrees, distance.km
+
+        passes = self.get_passes(now)
+        next_pass = passes[0] if passes else None
+        aos_time = next_pass["aos"] if next_pass else None
+        los_time = next_pass["los"] if next_pass else None
+        max_el_value = next_pass["max_el"] if next_pass else 0.0
 
         info = {
-            "sat_pos": f"{az.degrees:.1f}° / {el.degrees:.1f}°",
-            "ant_pos": f"{az.degrees:.1f}° / {el.degrees:.1f}°" if el.degrees > 0 else "N/A",
-            "range": f"{distance.km:.2f} km / {distance.km * 0.621371:.2f} mi",
-            "aos": f"{aos_time.utc_datetime().strftime('%I:%M:%S %p')} @ {aos_az.degrees:.1f}°" if aos_time is not None else "---",
-            "los": f"{los_time.utc_datetime().strftime('%I:%M:%S %p')} @ {los_az.degrees:.1f}°" if los_time is not None else "---",
-            "max_el": f"{max_el_value:.1f}°" if max_el_value > 0 else f"{el.degrees:.1f}°",
+            "sat_pos": f"{az_deg:.1f}° / {el_deg:.1f}°",
+            "ant_pos": f"{az_deg:.1f}° / {el_deg:.1f}°" if el_deg > 0 else "N/A",
+            "range": f"{range_km:.2f} km / {range_km * 0.621371:.2f} mi",
+            "aos": f"{aos_time.strftime('%I:%M:%S %p')} @ {next_pass['aos_az']:.1f}°" if aos_time is not None else "---",
+            "los": f"{los_time.strftime('%I:%M:%S %p')} @ {next_pass['los_az']:.1f}°" if los_time is not None else "---",
+            "max_el": f"{max_el_value:.1f}°" if max_el_value > 0 else f"{el_deg:.1f}°",
             "utc_time": now.strftime("%H:%M:%S"),
             "last_msg": "--:--"
         }
@@ -8,6 +8,7 @@ import requests
 import warnings
 import gpsd
 import geocoder
+from tlecatalog import get_catalog
 
 warnings.filterwarnings("ignore")
 
@@ -84,19 +85,10 @@ class SatelliteTracker:
 
 
     def read_tle(self, filename="tle.txt"):
-        if not os.path.exists(filename):
-            print(f"File {filename} does not exist.")
-            return None
-
-        with open(filename, 'r') as f:
-            lines = f.readlines()
-
-        for i in range(0, len(lines), 3):
-            if lines[i].strip() == self.satellite_name:
-                return lines[i:i+3]  # Return the three lines for the satellite
-
-        print(f"Satellite '{self.satellite_name}' not found in TLE data.")
-        return None
+        tle = get_catalog(filename).get(self.satellite_name)
+        if tle is None:
+            print(f"Satellite '{self.satellite_name}' not found in TLE data.")
+        return tle
 
 
     def get_satellite_loc(self, tle_data, observer_loc, observer_alt=0, observer_time=None):
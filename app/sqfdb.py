@@ -0,0 +1,104 @@
+from tlecatalog import normalize_name
+
+
+def parse_sqf_line(sqf_data):
+    """Parse one SQF line and return its components as a dictionary."""
+    fields = sqf_data.strip().split(",")
+    if len(fields) < 8:
+        return None
+    try:
+        return {
+            "satellite": fields[0],
+            "downlink_freq": int(fields[1]),
+            "uplink_freq": int(fields[2]),
+            "downlink_mode": fields[3],
+            "uplink_mode": fields[4],
+            "direction": fields[5],  # NOR or REV (inverting transponder)
+            "uplink_offset": int(fields[6]),
+            "downlink_offset": int(fields[7]),
+            "notes": ",".join(fields[8:]) if len(fields) > 8 else ""
+        }
+    except ValueError:
+        return None
+
+
+class SqfDatabase:
+    """In-memory transponder database loaded from a SatPC32 doppler.sqf file.
+
+    Every transponder row is kept, grouped per satellite, so a satellite
+    with several transponders (AO-7 has four) can be switched between by
+    index. Names are matched through normalize_name(), like the TLE
+    catalog. When a TLE catalog is given, satellites are also indexed by
+    the NORAD ID of their TLE, which each entry carries as ``norad_id``
+    (None when tle.txt has no TLE for it).
+    """
+
+    def __init__(self, filename="doppler.sqf", tle_catalog=None):
+        self.filename = filename
+        self.by_name = {}
+        self.by_norad = {}
+        self.load(tle_catalog)
+
+    def load(self, tle_catalog=None):
+        by_name = {}
+        try:
+            with open(self.filename, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            print(f"File {self.filename} does not exist.")
+            lines = []
+
+        for line in lines:
+            if not line.strip():
+                continue
+            entry = parse_sqf_line(line)
+            if entry is None:
+                print(f"Skipping invalid SQF line: {line.strip()}")
+                continue
+            entry["sqf_data"] = line.strip()
+            entry["norad_id"] = None
+            transponders = by_name.setdefault(normalize_name(entry["satellite"]), [])
+            entry["index"] = len(transponders)
+            transponders.append(entry)
+
+        by_norad = {}
+        if tle_catalog is not None:
+            for key, transponders in by_name.items():
+                tle = tle_catalog.get(key)
+                if tle is not None:
+                    norad_id = int(tle[1][2:7])
+                    by_norad[norad_id] = transponders
+                    for entry in transponders:
+                        entry["norad_id"] = norad_id
+
+        self.by_name = by_name
+        self.by_norad = by_norad
+
+    def get(self, key):
+        """Return all transponder entries for a satellite name or NORAD ID."""
+        if isinstance(key, int) or (isinstance(key, str) and key.strip().isdigit()):
+            transponders = self.by_norad.get(int(key))
+            if transponders is not None:
+                return transponders
+        if isinstance(key, str):
+            return self.by_name.get(normalize_name(key), [])
+        return []
+
+    def get_transponder(self, key, index=0):
+        transponders = self.get(key)
+        if 0 <= index < len(transponders):
+            return transponders[index]
+        return None
+
+    def names(self):
+        return [transponders[0]["satellite"] for transponders in self.by_name.values()]
+
+    def __len__(self):
+        return sum(len(transponders) for transponders in self.by_name.values())
+
+
+if __name__ == "__main__":
+    db = SqfDatabase("doppler.sqf")
+    print(f"Loaded {len(db)} transponders for {len(db.by_name)} satellites")
+    for entry in db.get("AO-7"):
+        print(entry)
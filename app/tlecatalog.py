@@ -0,0 +1,160 @@
+import os
+import re
+import threading
+import time
+
+# Names that differ between doppler.sqf and tle.txt beyond what
+# normalize_name() absorbs, as normalized SQF name -> normalized TLE name
+NAME_ALIASES = {
+    "MOVE2": "MOVEII",
+}
+
+
+def normalize_name(name):
+    """Lookup key for a satellite name: "AO-07", "AO 7" and "ao-7" all become "AO7"."""
+    key = re.sub(r"[^A-Z0-9]", "", name.strip().upper())
+    key = re.sub(r"\d+", lambda m: str(int(m.group())), key)
+    return NAME_ALIASES.get(key, key)
+
+
+def name_keys(name):
+    """Keys a TLE name is indexed under: the name, and "B" too for "A (B)"."""
+    keys = [normalize_name(re.sub(r"\(.*?\)", "", name))]
+    keys += [normalize_name(alias) for alias in re.findall(r"\((.*?)\)", name)]
+    return [key for key in keys if key]
+
+
+def tle_checksum(line):
+    """Modulo-10 checksum of a TLE line: digits count as-is, '-' counts as 1."""
+    total = 0
+    for ch in line[:68]:
+        if ch.isdigit():
+            total += int(ch)
+        elif ch == '-':
+            total += 1
+    return total % 10
+
+
+def tle_line_valid(line, line_no):
+    if len(line) < 69 or not line.startswith(f"{line_no} "):
+        return False
+    return line[68].isdigit() and int(line[68]) == tle_checksum(line)
+
+
+class TleCatalog:
+    """In-memory TLE catalog indexed by satellite name and NORAD ID.
+
+    Names are matched through normalize_name(), so the SatPC32 names used
+    in doppler.sqf ("AO-7") find their TLE ("AO-07"); a parenthesized
+    alias such as "HADES-R (SO-124)" is indexed under both names.
+
+    The file is parsed once and only re-read when its mtime changes. The
+    mtime itself is checked at most every ``check_interval`` seconds, so
+    lookups normally never touch the disk.
+    """
+
+    def __init__(self, filename="tle.txt", check_interval=5.0):
+        self.filename = filename
+        self.check_interval = check_interval
+        self.by_name = {}
+        self.by_norad = {}
+        self.mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def parse(self, lines):
+        """Parse TLE text lines into (by_name, by_norad) indexes.
+
+        ``by_name`` is keyed by name_keys(); the first TLE to claim a key wins.
+        """
+        by_name = {}
+        by_norad = {}
+        name = None
+        line1 = None
+        for raw in lines:
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith("1 ") and len(line) >= 69:
+                line1 = line
+                continue
+            if line.startswith("2 ") and len(line) >= 69 and line1 is not None:
+                if not (tle_line_valid(line1, 1) and tle_line_valid(line, 2)):
+                    print(f"Skipping TLE with bad checksum: {name}")
+                else:
+                    norad_id = int(line1[2:7])
+                    sat_name = name or str(norad_id)
+                    record = [sat_name, line1, line]
+                    for key in name_keys(sat_name):
+                        by_name.setdefault(key, record)
+                    by_norad[norad_id] = record
+                name = None
+                line1 = None
+                continue
+            name = line
+            line1 = None
+        return by_name, by_norad
+
+    def refresh(self, force=False):
+        """Re-read the file if its mtime changed. Returns True if it was reloaded."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and now < self._next_check:
+                return False
+            self._next_check = now + self.check_interval
+            try:
+                mtime = os.path.getmtime(self.filename)
+            except OSError:
+                if force:
+                    print(f"File {self.filename} does not exist.")
+                return False
+            if not force and mtime == self.mtime:
+                return False
+            with open(self.filename, 'r') as f:
+                self.by_name, self.by_norad = self.parse(f)
+            self.mtime = mtime
+            return True
+
+    def get(self, key):
+        """Look up a TLE record ([name, line1, line2]) by name or NORAD ID."""
+        self.refresh()
+        if isinstance(key, int) or (isinstance(key, str) and key.strip().isdigit()):
+            record = self.by_norad.get(int(key))
+            if record is not None:
+                return record
+        if isinstance(key, str):
+            return self.by_name.get(normalize_name(key))
+        return None
+
+    def names(self):
+        self.refresh()
+        return [record[0] for record in self.by_norad.values()]
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return len(self.by_norad)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_catalog(filename="tle.txt"):
+    """Return the process-wide shared TleCatalog for ``filename``."""
+    path = os.path.abspath(filename)
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None:
+            catalog = TleCatalog(filename)
+            _catalogs[path] = catalog
+        return catalog
+
+
+if __name__ == "__main__":
+    catalog = get_catalog("tle.txt")
+    print(f"Loaded {len(catalog)} satellites")
+    print(catalog.get("ISS"))
+    print(catalog.get(25544))
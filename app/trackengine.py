@@ -0,0 +1,333 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+from numpy import long
+
+from broadcast import Broadcaster
+from dopplercal import DopplerCalculator, DopplerEngine, DopplerScheduler, doppler_shift
+from ephemeris import EphemerisService
+from metrics import DOPPLER_ERROR_HZ, TICK_ERRORS, TICK_LATENESS_SECONDS, TICK_SECONDS
+from passplanner import PassPlanner
+from rigcontrol import RigShadow
+from sattrack import SatelliteTracker
+
+RETRY_SECONDS = 5
+
+
+class TrackingSession:
+    """One satellite/transponder tracked on one rig.
+
+    Holds what used to be the global doppler_loop state: the RIG_CONTROL
+    and SAT_INFO dicts, the rig client, the Doppler engine and scheduler,
+    plus a per-session telemetry broadcaster. ``tick()`` runs one Doppler
+    update and returns the seconds until the next one; the TrackingEngine
+    runs it as a task on its event loop. Rig I/O is awaited, so a slow
+    radio only delays this session.
+    """
+
+    def __init__(self, session_id, sqf_data, rig, tle_catalog, grid_locator, altitude,
+                 step_hz=1, poll_seconds=2.0):
+        self.id = session_id
+        self.rig = rig
+        self.shadow = RigShadow(rig, poll_seconds)
+        self.tle_catalog = tle_catalog
+        self.grid_locator = grid_locator
+        self.altitude = altitude
+        self.lat, self.lon = DopplerCalculator().grid_to_latlon(grid_locator)
+        self.ephemeris = None
+        self.tracker = None
+        self.step_hz = step_hz
+        self.ready = False
+        self.telemetry = Broadcaster()
+
+        # Rig control state; updated on every tick
+        self.rig_control = {
+            "tx_tune_freq": 0,
+            "rx_tune_freq": 0,
+            "doppler_rx": 0,
+            "doppler_tx": 0,
+            "rx_actual_freq": 0,
+            "tx_actual_freq": 0,
+            "running": True
+        }
+
+        # Satellite information for the UI
+        self.sat_info = {
+            "name": None,
+            "uplink_freq": 0,  # in kHz
+            "downlink_freq": 0,  # in kHz
+            "mode": None,
+            "sqf_data": sqf_data,
+            "TLE_DATA": None
+        }
+
+    @property
+    def running(self):
+        return self.rig_control["running"]
+
+    def describe(self):
+        return {
+            "id": self.id,
+            "satellite": self.sat_info["name"],
+            "sqf_data": self.sat_info["sqf_data"],
+            "rig": f"{self.rig.host}:{self.rig.port}",
+            "rig_queue": self.rig.stats(),
+            "rig_reads": self.shadow.stats(),
+            "running": self.running,
+        }
+
+    def rig_state(self):
+        return {
+            'RIG_CONTROL': {
+                k: int(v) if isinstance(v, (int, np.integer)) else v
+                for k, v in self.rig_control.items()
+            }
+        }
+
+    def tracking_info(self):
+        tle = self.sat_info["TLE_DATA"]
+        if not tle or len(tle) < 3:
+            return None
+        # AOS/LOS come from the session's own propagator, so the dashboard
+        # agrees with when the Doppler loop starts retuning. A TLE refresh
+        # replaces the ephemeris satellite and with it the tracker.
+        tracker = self.tracker
+        if tracker is None or tracker.satellite is not self.ephemeris.satellite:
+            tracker = self.tracker = SatelliteTracker.for_ephemeris(self.ephemeris)
+        return tracker.get_tracking_info(self.ephemeris.current())
+
+    def publish_state(self):
+        """Push the current rig and tracking state to every stream subscriber."""
+        if not self.telemetry.has_subscribers():
+            return
+        self.telemetry.publish("rig", self.rig_state())
+        info = self.tracking_info()
+        if info is not None:
+            self.telemetry.publish("track", info)
+
+    async def setup(self):
+        """Resolve satellite, TLE and observer and put the rig into split mode."""
+        doppler_calculator = DopplerCalculator()
+
+        sqf = doppler_calculator.read_sqf_data(sqf_data=self.sat_info["sqf_data"])
+        self.satellite_name = sqf["satellite"]
+        self.tx_org_freq = sqf["uplink_freq"] * 1000  # Convert to Hz
+        self.rx_org_freq = sqf["downlink_freq"] * 1000  # Convert to Hz
+
+        self.tle_data = self.tle_catalog.get(self.satellite_name)
+        if self.tle_data is None:
+            raise ValueError(f"No TLE for '{self.satellite_name}'")
+
+        print(f"[{self.id}] {self.tle_data}")
+
+        # The one propagator for this session: Doppler tables, passes, the
+        # tracker readout and the map position all read from it.
+        self.ephemeris = EphemerisService(self.tle_data, self.lat, self.lon, self.altitude)
+        self.doppler_engine = DopplerEngine(self.ephemeris, planner=PassPlanner(self.ephemeris))
+        self.scheduler = DopplerScheduler(self.doppler_engine, step_hz=self.step_hz)
+        # Taken here rather than in __init__: replacing a session removes the
+        # old one's series, which would orphan children created beforehand.
+        self.rx_error_metric = DOPPLER_ERROR_HZ.labels(self.id, "rx")
+        self.tx_error_metric = DOPPLER_ERROR_HZ.labels(self.id, "tx")
+        self.carriers = [(self.rx_org_freq, sqf["downlink_mode"]), (self.tx_org_freq, sqf["uplink_mode"])]
+
+        await self.shadow.set_freq(self.rx_org_freq)
+        # Downlink-only rows (uplink 0, e.g. the ISS APRS/SSTV downlink)
+        # never touch the TX VFO, and must not leave the rig in split.
+        if self.tx_org_freq:
+            await self.rig.set_split()
+        else:
+            await self.rig.reset_split()
+        rx_tune = long(await self.shadow.get_freq(force=True))
+        self.rx_tune_predict = rx_tune
+
+        # Last values actually written to the rig; writes are skipped when
+        # the change is below the tuning step or the satellite is not up.
+        self.rx_sent_freq = rx_tune
+        self.rx_sent_doppler = 0
+        self.tx_sent_freq = None
+        self.ready = True
+
+    async def tick(self):
+        """Run one Doppler update; returns seconds until the next one."""
+        if not self.ready:
+            await self.setup()
+        return await self._tick()
+
+    async def _tick(self):
+        # Pick up refreshed TLEs from the shared catalog (no disk access
+        # unless tle.txt changed).
+        latest_tle = self.tle_catalog.get(self.satellite_name)
+        if latest_tle is not None and latest_tle != self.tle_data:
+            self.tle_data = latest_tle
+            self.doppler_engine.set_tle(self.tle_data)
+
+        # Update frequencies if radio change. The shadow answers from cache
+        # and only reads the rig when its poll interval has passed.
+        rx_read_freq = long(await self.shadow.get_freq())
+        if self.rx_sent_freq != rx_read_freq:
+            rx_tune = rx_read_freq + self.rx_sent_doppler
+        else:
+            rx_tune = self.rx_tune_predict
+
+        # Doppler predicted for the moment the retune reaches the rig
+        tick_start = time.time()
+        apply_at = self.doppler_engine.apply_time(tick_start)
+        # Building a pass table can take a while; keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, self.doppler_engine.refresh, apply_at)
+        # One range-rate for both carriers keeps RX and TX Doppler consistent
+        range_rate = self.doppler_engine.range_rate(apply_at)
+        rx_doppler = doppler_shift(self.rx_org_freq, range_rate)
+        rx_diff_freq = (rx_tune - rx_doppler) - (self.rx_org_freq - rx_doppler)
+        rx_tune_predict = self.rx_org_freq + rx_diff_freq
+        rx_actual_freq = rx_tune_predict - rx_doppler
+
+        if self.tx_org_freq:
+            tx_doppler = doppler_shift(self.tx_org_freq, range_rate)
+            tx_tune_predict = self.tx_org_freq - rx_diff_freq
+            tx_actual_freq = tx_tune_predict - tx_doppler
+        else:
+            tx_doppler = tx_tune_predict = tx_actual_freq = 0
+
+        # RX and TX retune pipelined in a single round-trip
+        if self.scheduler.is_visible(apply_at) and (
+                self.scheduler.needs_write(self.rx_sent_freq, rx_actual_freq)
+                or (self.tx_org_freq and self.scheduler.needs_write(self.tx_sent_freq, tx_actual_freq))):
+            if self.tx_org_freq:
+                await self.shadow.retune(rx_actual_freq, tx_actual_freq)
+            else:
+                await self.shadow.set_freq(rx_actual_freq)
+            applied_at = time.time()
+            self.doppler_engine.record_latency(applied_at - tick_start)
+            # Residual Doppler error: what the rig should have had when the
+            # retune landed versus what was sent for the predicted time
+            applied_rate = self.doppler_engine.range_rate(applied_at)
+            self.rx_error_metric.set(doppler_shift(self.rx_org_freq, applied_rate) - rx_doppler)
+            if self.tx_org_freq:
+                self.tx_error_metric.set(doppler_shift(self.tx_org_freq, applied_rate) - tx_doppler)
+            self.rx_sent_freq, self.rx_sent_doppler = rx_actual_freq, rx_doppler
+            self.tx_sent_freq = tx_actual_freq
+
+        print(f"[{self.id}][RX] Tune: {rx_tune_predict}, Doppler: {rx_doppler}, Actual: {rx_actual_freq}")
+        print(f"[{self.id}][TX] Tune: {tx_tune_predict}, Doppler: {tx_doppler}, Actual: {tx_actual_freq}")
+
+        self.rx_tune_predict = rx_tune_predict
+
+        # Update session state
+        self.rig_control["rx_actual_freq"] = rx_actual_freq
+        self.rig_control["tx_actual_freq"] = tx_actual_freq
+        self.rig_control["rx_tune_freq"] = rx_tune_predict
+        self.rig_control["tx_tune_freq"] = tx_tune_predict
+        self.rig_control["doppler_rx"] = rx_doppler
+        self.rig_control["doppler_tx"] = tx_doppler
+        self.sat_info["name"] = self.satellite_name
+        self.sat_info["uplink_freq"] = self.tx_org_freq // 1000  # Convert to kHz
+        self.sat_info["downlink_freq"] = self.rx_org_freq // 1000  # Convert to kHz
+        self.sat_info["TLE_DATA"] = self.tle_data
+
+        self.publish_state()
+
+        return self.scheduler.next_interval(self.carriers, apply_at)
+
+    async def stop(self):
+        self.rig_control["running"] = False
+        if self.ready:
+            await self.rig.reset_split()
+        self.ready = False
+
+
+class TrackingEngine:
+    """Runs any number of TrackingSessions as tasks on one asyncio event loop.
+
+    The loop lives in a daemon thread so Flask's request threads can hand
+    work to it through ``call()``. Each session is a single task that
+    awaits its tick and then sleeps for the interval the tick asked for,
+    so a session is never ticked concurrently with itself and a stuck rig
+    only stalls its own task.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.tasks = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def call(self, coro, timeout=None):
+        """Run ``coro`` on the engine loop from another thread and wait for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def _run(self, session):
+        tick_seconds = TICK_SECONDS.labels(session.id)
+        lateness = TICK_LATENESS_SECONDS.labels(session.id)
+        errors = TICK_ERRORS.labels(session.id)
+        due = self.loop.time()
+        while session.running:
+            started = self.loop.time()
+            lateness.observe(max(0.0, started - due))
+            try:
+                delay = await session.tick()
+            except Exception as e:
+                errors.inc()
+                print(f"[{session.id}] Tracking error: {e}")
+                delay = RETRY_SECONDS
+            tick_seconds.observe(self.loop.time() - started)
+            due = self.loop.time() + delay
+            await asyncio.sleep(delay)
+
+    async def _start(self, session):
+        await self._cancel(session.id)
+        self.tasks[session.id] = self.loop.create_task(self._run(session))
+
+    async def _cancel(self, session_id):
+        task = self.tasks.pop(session_id, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def _remove(self, session_id):
+        await self._cancel(session_id)
+        session = self.sessions.pop(session_id, None)
+        if session is not None:
+            await session.stop()
+            await session.rig.aclose()
+            # Open /stream clients reconnect and pick up the new session
+            session.telemetry.close()
+        # Drop the session's series so /metrics stops exporting them
+        for metric in (TICK_SECONDS, TICK_LATENESS_SECONDS, TICK_ERRORS):
+            metric.remove(session_id)
+        for carrier in ("rx", "tx"):
+            DOPPLER_ERROR_HZ.remove(session_id, carrier)
+        return session
+
+    async def _restart(self, session):
+        await self._cancel(session.id)
+        session.ready = False
+        session.rig_control["running"] = True
+        await self._start(session)
+        return session
+
+    def add(self, session):
+        if session.id in self.sessions:
+            self.remove(session.id)
+        self.sessions[session.id] = session
+        self.call(self._start(session))
+        return session
+
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+
+    def remove(self, session_id):
+        return self.call(self._remove(session_id))
+
+    def restart(self, session_id):
+        """Re-run setup for a session, e.g. after a transponder change or rig reset."""
+        session = self.sessions.get(session_id)
+        if session is None:
+            return None
+        return self.call(self._restart(session))